@@ -11,7 +11,29 @@ from code_modifier_agent import CodeModifierAgent
 from code_explainer_agent import CodeExplainerAgent
 from typing import Optional, Dict, Any
 import os
+import threading
 from rag_agent import RAGAgent
+from knowledge_base import KnowledgeBaseRegistry, default_registry
+from tool_router import ToolRouter, RouteDecision
+
+# 本地路由规则：常见命令直接选择工具，规则冲突或未命中时再让模型选择
+TOOL_ROUTING_RULES = {
+    "converter": [
+        (r"转换|转成|转为|翻译|迁移|移植", 2.0),
+        (r"\b(convert|translate|port|migrate)\b", 2.0),
+        (r"(c\+\+|cpp).{0,10}(到|成|为|->|to)\s*rust", 2.0)
+    ],
+    "modifier": [
+        (r"修复|修正|改正|纠正|修改", 2.0),
+        (r"\b(fix|repair|debug)\b", 2.0),
+        (r"编译(错误|失败|不通过)|报错|\berrors?\b|\bbug", 1.5),
+        (r"优化|性能|不一致|运行失败|测试", 1.0)
+    ],
+    "explainer": [
+        (r"解释|讲解|什么意思|是什么|为什么|原理|区别|差异|怎么理解", 2.0),
+        (r"\b(explain|why|what)\b|how does", 2.0)
+    ]
+}
 
 class CodeToolboxAgent(AIAgent):
     def __init__(
@@ -22,7 +44,10 @@ class CodeToolboxAgent(AIAgent):
         output_dir: str,
         knowledge_base_path: str = "./knowledge_base",
         embedding_model: str = "all-MiniLM-L6-v2",
-        max_history: int = 10
+        max_history: int = 10,
+        registry: Optional[KnowledgeBaseRegistry] = None,
+        warmup: bool = True,
+        router: Optional[ToolRouter] = None
     ):
         """
         初始化带RAG功能的工具箱Agent
@@ -33,6 +58,9 @@ class CodeToolboxAgent(AIAgent):
         :param knowledge_base_path: 知识库目录路径
         :param embedding_model: 使用的embedding模型名称
         :param max_history: 对话历史长度初始化代码
+        :param registry: 共享知识库索引的注册表，所有RAG工具共用同一份知识库索引
+        :param warmup: 启动时在后台预加载模型（Ollama 按 keep_alive 常驻内存），避免首次请求等待模型加载
+        :param router: 本地工具路由器，置信度低时才调用模型选择工具；默认使用 TOOL_ROUTING_RULES
         """
         
         system_prompt = (
@@ -70,6 +98,10 @@ class CodeToolboxAgent(AIAgent):
             model_name=model_name,
             max_history=max_history
         )
+
+        # 预热与知识库加载等初始化工作并行进行
+        if warmup:
+            threading.Thread(target=client.warmup, args=(model_name,), daemon=True).start()
         
         self.cpp_path = cpp_path
         self.output_dir = output_dir
@@ -78,7 +110,10 @@ class CodeToolboxAgent(AIAgent):
             os.path.splitext(os.path.basename(cpp_path))[0] + ".rs"
         )
         
-        # 初始化工具，但使用 RAG 功能
+        self.router = router or ToolRouter(TOOL_ROUTING_RULES)
+
+        # 初始化工具，RAG 工具通过注册表共享同一份知识库索引
+        self.registry = registry or default_registry
         self.tools = {
             "converter": CodeConverterAgent(
                 client=client,
@@ -86,7 +121,8 @@ class CodeToolboxAgent(AIAgent):
                 input_path=self.cpp_path,
                 output_dir=self.output_dir,
                 knowledge_base_path=knowledge_base_path,  # 添加知识库支持
-                embedding_model=embedding_model
+                embedding_model=embedding_model,
+                registry=self.registry
             ),
             "modifier": CodeModifierAgent(
                 client=client,
@@ -94,7 +130,8 @@ class CodeToolboxAgent(AIAgent):
                 rust_path=self.rust_path,
                 cpp_path=self.cpp_path,
                 knowledge_base_path=knowledge_base_path,  # 添加知识库支持
-                embedding_model=embedding_model
+                embedding_model=embedding_model,
+                registry=self.registry
             ),
             "explainer": CodeExplainerAgent(
                 client=client,
@@ -104,24 +141,33 @@ class CodeToolboxAgent(AIAgent):
             )
         }
         
+    def close(self):
+        """释放各RAG工具对共享知识库索引的引用"""
+        for tool in self.tools.values():
+            if isinstance(tool, RAGAgent):
+                tool.close()
+
     def _parse_tool_choice(self, response: str) -> Dict[str, str]:
-        """解析工具选择响应"""
-        try:
-            import json
-            result = json.loads(response)
-            if not all(k in result for k in ["tool", "reason", "action"]):
-                raise ValueError("响应缺少必要字段")
-            return result
-        except json.JSONDecodeError:
-            raise ValueError("无效的JSON格式")
+        """解析工具选择响应，格式不符时请求模型修复JSON"""
+        def validate(result: Dict):
+            if result["tool"] not in self.tools:
+                raise ValueError(f"未知的工具: {result['tool']}，必须是 {'、'.join(self.tools)} 之一")
+
+        return self._parse_structured(
+            response,
+            {"tool": str, "reason": str, "action": str},
+            validator=validate,
+            max_tokens=500
+        )
     
-    def process_request(self, user_input: str, input_file: Optional[str] = None) -> str:
+    def _route(self, user_input: str) -> RouteDecision:
         """
-        处理用户请求
-        :param user_input: 用户输入
-        :param input_file: 可选的输入文件路径
-        :return: 处理结果
+        选择工具：先查本地路由器（缓存和规则），置信度不足时再让模型选择，并缓存模型的选择
         """
+        decision = self.router.route(user_input)
+        if decision is not None:
+            return decision
+
         # 让模型选择工具
         response = self.chat(
             f"用户请求：{user_input}\n请选择合适的工具并说明原因",
@@ -129,13 +175,25 @@ class CodeToolboxAgent(AIAgent):
             temperature=0.3
         )
         print(response)
+        choice = self._parse_tool_choice(response)
+        decision = RouteDecision(tool=choice["tool"], action=choice["action"],
+                                 reason=choice["reason"], source="llm")
+        self.router.remember(user_input, decision)
+        return decision
+
+    def process_request(self, user_input: str, input_file: Optional[str] = None) -> str:
+        """
+        处理用户请求
+        :param user_input: 用户输入
+        :param input_file: 可选的输入文件路径
+        :return: 处理结果
+        """
         try:
-            # 解析工具选择
-            choice = self._parse_tool_choice(response)
-            tool_name = choice["tool"]
-            action = choice["action"]
+            decision = self._route(user_input)
+            tool_name = decision.tool
+            action = decision.action
             
-            print(f"\n选择工具: {tool_name}")
+            print(f"\n选择工具: {tool_name}（{decision.source}）")
             print(f"建议操作: {action}\n")
             
             # 执行工具操作
@@ -1,5 +1,12 @@
 from unified_llm_client import UnifiedLLMClient
-from typing import Dict, Optional, List
+from async_llm_client import AsyncUnifiedLLMClient
+from token_counter import estimate_tokens
+from structured_output import (
+    Schema, Validator, StructuredOutputError, parse_json_response, describe_schema
+)
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, List, Iterator
+import json
 
 class AIAgent:
     def __init__(
@@ -7,7 +14,11 @@ class AIAgent:
         client: UnifiedLLMClient,
         system_prompt: str,
         model_name: str,
-        max_history: int = 5  # 保留最近的对话轮次
+        max_history: int = 5,  # 保留最近的对话轮次
+        history_token_budget: Optional[int] = None,
+        token_counter: Optional[Callable[[str], int]] = None,
+        summarize_evicted: bool = False,
+        summarizer: Optional[Callable[[str, List[Dict]], str]] = None
     ):
         """
         初始化 AI Agent
@@ -15,12 +26,25 @@ class AIAgent:
         :param system_prompt: 系统角色设定（例如 "你是一个幽默的助手"）
         :param model_name: UnifiedLLMClient 中已配置的模型名称（如 "gpt-4"）
         :param max_history: 保留的对话历史长度（防止上下文过长）
+        :param history_token_budget: 对话历史的 token 上限，默认取模型配置中的 "history_token_budget"，
+                                     超出时从最早的轮次开始整轮淘汰，系统提示始终保留
+        :param token_counter: token 计数函数，默认为 estimate_tokens，
+                              可替换为 token_counter.make_tiktoken_counter() 等基于分词器的实现
+        :param summarize_evicted: 是否调用模型把被淘汰的轮次合并为一段摘要并保留在系统提示之后
+        :param summarizer: 自定义摘要函数 (已有摘要, 被淘汰的消息) -> 新摘要，优先于 summarize_evicted
         """
         self.client = client
         self.system_prompt = system_prompt
         self.model_name = model_name
         self.max_history = max_history
         self.message_history: List[Dict] = []
+        model_config = client.active_models[model_name]["config"]
+        self.history_token_budget = history_token_budget or model_config.get("history_token_budget")
+        self.token_counter = token_counter or estimate_tokens
+        self.summarizer = summarizer or (self._summarize_with_llm if summarize_evicted else None)
+        self.history_summary = ""
+        self._summary_message: Optional[Dict] = None
+        self._static_message: Optional[Dict] = None
 
         # 初始化时添加系统提示
         self._add_system_prompt()
@@ -43,9 +67,14 @@ class AIAgent:
             })
         else:
             # 通用方式：将系统提示作为第一条用户消息
+            # 固定的输出要求放在系统提示中，而不是每次追加在提示末尾，保持提示前缀稳定
+            instruction = "不要写出多余的思考步骤"
+            system_prompt = self.system_prompt
+            if instruction not in system_prompt:
+                system_prompt = f"{system_prompt}\n{instruction}"
             self.message_history.append({
                 "role": "user",
-                "content": f"System Prompt: {self.system_prompt}"
+                "content": f"System Prompt: {system_prompt}"
             })
 
     def chat(self, user_input: str, **kwargs) -> str:
@@ -55,30 +84,210 @@ class AIAgent:
         :param kwargs: 传递给 UnifiedLLMClient.generate() 的额外参数
         :return: 模型生成的回复
         """
+        prompt = self._prepare_prompt(user_input)
+
+        # 调用模型生成回复
+        response = self.client.generate(
+            model_name=self.model_name,
+            prompt=prompt,
+            **kwargs
+        )
+
+        self._record_response(response)
+        return response
+
+    def chat_stream(self, user_input: str, **kwargs) -> Iterator[str]:
+        """
+        流式执行一次对话，逐段返回模型输出
+        完整回复在生成结束后记录到对话历史
+        :param user_input: 用户输入文本
+        :param kwargs: 传递给 UnifiedLLMClient.generate_stream() 的额外参数
+        """
+        prompt = self._prepare_prompt(user_input)
+
+        chunks = []
+        try:
+            for chunk in self.client.generate_stream(
+                model_name=self.model_name,
+                prompt=prompt,
+                **kwargs
+            ):
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            # 调用方提前结束迭代时也记录已生成的部分
+            if chunks:
+                self._record_response("".join(chunks))
+
+    async def achat(self, user_input: str, async_client: AsyncUnifiedLLMClient, **kwargs) -> str:
+        """
+        异步执行一次对话
+        同一个 Agent 的对话历史是顺序的，并发调用应使用不同的 Agent 实例
+        :param user_input: 用户输入文本
+        :param async_client: 复用本 Agent 模型配置的 AsyncUnifiedLLMClient
+        :param kwargs: 传递给 AsyncUnifiedLLMClient.agenerate() 的额外参数
+        :return: 模型生成的回复
+        """
+        prompt = self._prepare_prompt(user_input)
+        response = await async_client.agenerate(
+            model_name=self.model_name,
+            prompt=prompt,
+            **kwargs
+        )
+        self._record_response(response)
+        return response
+
+    def chat_many(self, user_input: str, variants: List[Dict], **kwargs) -> List[Optional[str]]:
+        """
+        对同一输入并发生成多个候选回复（例如不同温度或不同模型）
+        对话历史只记录用户输入，调用方选定候选后应调用 _record_response() 记录
+        :param user_input: 用户输入文本
+        :param variants: 每个候选的参数，可包含 model_name 以及传递给 generate() 的参数（如 temperature）
+        :param kwargs: 所有候选共用的 generate() 参数
+        :return: 与 variants 一一对应的回复，生成失败的位置为 None
+        """
+        augmented_input = self._augment_input(user_input)
+        self.message_history.append({
+            "role": "user",
+            "content": user_input
+        })
+        self._trim_history()
+        # 在当前线程构造好各模型的 prompt，工作线程只读
+        model_names = {variant.get("model_name", self.model_name) for variant in variants}
+        prompts = {
+            model_name: self._build_model_prompt(model_name, augmented_input)
+            for model_name in model_names
+        }
+
+        def generate(variant: Dict) -> Optional[str]:
+            params = dict(kwargs, **variant)
+            model_name = params.pop("model_name", self.model_name)
+            try:
+                return self.client.generate(model_name=model_name, prompt=prompts[model_name], **params)
+            except Exception as e:
+                print(f"候选回复生成失败（{model_name}）：{str(e)}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=max(len(variants), 1)) as executor:
+            return list(executor.map(generate, variants))
+
+    def set_static_context(self, content: Optional[str]):
+        """
+        设置固定在系统提示之后的静态上下文（如参考代码），多轮对话中只出现一次且位置不变，
+        服务端可以复用这段提示前缀的 KV 缓存；内容变化时原位更新，传入 None 时移除
+        """
+        if not content:
+            if self._static_message is not None:
+                self.message_history = [m for m in self.message_history if m is not self._static_message]
+                self._static_message = None
+            return
+        if self._static_message is None:
+            self._static_message = {"role": "system", "content": content}
+            self.message_history.insert(1, self._static_message)
+        else:
+            self._static_message["content"] = content
+
+    def _augment_input(self, user_input: str) -> str:
+        """
+        构造本轮实际发送的用户消息（子类可附加检索结果等易变内容）
+        增强后的内容只出现在最新一条消息中，对话历史只记录原始输入
+        """
+        return user_input
+
+    def _prepare_prompt(self, user_input: str):
+        """将用户输入加入历史，并构造模型所需的 prompt（根据模型类型适配）"""
+        augmented_input = self._augment_input(user_input)
         # 添加用户输入到历史
         self.message_history.append({
             "role": "user",
             "content": user_input
         })
+        self._trim_history()
+        return self._build_model_prompt(self.model_name, augmented_input)
 
-        # 构造模型所需的 prompt（根据模型类型适配）
-        model_config = self.client.active_models[self.model_name]["config"]
+    def _build_model_prompt(self, model_name: str, augmented_input: Optional[str] = None):
+        """
+        根据当前历史构造指定模型所需的 prompt
+        顺序为：系统提示、静态上下文、摘要、历史轮次、最新消息（易变内容只在末尾），
+        相邻两轮的提示共享尽可能长的前缀
+        """
+        messages = self.message_history
+        if augmented_input is not None and messages and messages[-1]["role"] == "user":
+            messages = messages[:-1] + [{"role": "user", "content": augmented_input}]
+        model_config = self.client.active_models[model_name]["config"]
         if model_config.get("prompt_field") == "messages":
             # OpenAI 风格：直接使用消息历史
-            prompt = self.message_history
-        else:
-            # 通用模型：拼接历史对话为字符串
-            formatted = self._format_history_to_text()
-            # 在提示的最后添加"不要写出多余的思考步骤"
-            prompt = f"{formatted}\n不要写出多余的思考步骤"
+            return messages
+        # 通用模型：拼接历史对话为字符串
+        return self._format_history_to_text(messages)
 
-        # 调用模型生成回复
-        response = self.client.generate(
-            model_name=self.model_name,
-            prompt=prompt,
-            **kwargs
-        )
+    def _parse_structured(
+        self,
+        response: str,
+        schema: Optional[Schema] = None,
+        validator: Optional[Validator] = None,
+        repair_attempts: int = 1,
+        max_tokens: int = 2000
+    ) -> dict:
+        """
+        解析回复中的 JSON 并按 schema 校验（容忍代码块、前后说明文字和常见格式问题）
+        仍然失败时不重新生成，而是把原回复发给模型只修复 JSON（不带对话历史，成本远低于重新生成），
+        修复成功后用修复后的 JSON 替换对话历史中的原回复
+        :param schema: 必需字段 -> 期望类型
+        :param validator: 额外的校验函数，不合法时抛出 ValueError
+        :param repair_attempts: 修复请求的最多次数，0 表示只在本地解析
+        :param max_tokens: 修复请求的 max_tokens，应足以容纳完整的 JSON
+        :raises StructuredOutputError: 本地解析和修复请求都失败
+        """
+        try:
+            return parse_json_response(response, schema, validator)
+        except StructuredOutputError as e:
+            error = e
+
+        broken = response
+        for _ in range(repair_attempts):
+            print(f"JSON解析失败（{str(error)}），请求模型修复JSON...")
+            fields = describe_schema(schema)
+            prompt = (
+                f"下面的内容应当是一个JSON对象，但无法使用：{str(error)}\n"
+                + (f"必需字段：{fields}\n" if fields else "")
+                + "请只修复JSON格式，不要改动字段内容，只输出修复后的JSON，不要输出任何其他文字。\n\n"
+                f"{broken}"
+            )
+            try:
+                broken = self.client.generate(
+                    model_name=self.model_name,
+                    prompt=self._standalone_prompt(prompt),
+                    max_tokens=max_tokens,
+                    temperature=0
+                )
+                result = parse_json_response(broken, schema, validator)
+            except StructuredOutputError as e:
+                error = e
+                continue
+            except Exception as e:
+                print(f"JSON修复请求失败：{str(e)}")
+                break
+            self._replace_response(response, json.dumps(result, ensure_ascii=False))
+            return result
+        raise error
 
+    def _replace_response(self, old: str, new: str):
+        """替换对话历史中最近一条内容为 old 的模型回复"""
+        for message in reversed(self.message_history):
+            if message["role"] == "assistant" and message["content"] == old:
+                message["content"] = new
+                return
+
+    def _standalone_prompt(self, prompt: str):
+        """构造不带对话历史的单轮请求（按模型类型使用消息列表或纯文本）"""
+        model_config = self.client.active_models[self.model_name]["config"]
+        if model_config.get("prompt_field") == "messages":
+            return [{"role": "user", "content": prompt}]
+        return prompt
+
+    def _record_response(self, response: str):
+        """将模型回复加入历史并限制历史长度"""
         # 添加模型回复到历史
         self.message_history.append({
             "role": "assistant",
@@ -86,15 +295,84 @@ class AIAgent:
         })
 
         # 限制历史长度
-        if len(self.message_history) > self.max_history * 2:  # 保留 max_history 轮对话
-            self.message_history = self.message_history[-self.max_history * 2:]
+        self._trim_history()
 
-        return response
+    def _trim_history(self):
+        """
+        裁剪对话历史：系统提示（以及已有的摘要）始终保留；
+        其余消息超过 max_history 轮或超出 token 预算时，从最早的轮次开始整轮淘汰，
+        最新的一条消息（当前输入）无论多长都保留。配置了摘要函数时，被淘汰的轮次会合并进摘要
+        """
+        pinned_count = 1 + (self._static_message is not None) + (self._summary_message is not None)
+        pinned = self.message_history[:pinned_count]
+        turns = self.message_history[pinned_count:]
+        counts = [self._message_tokens(message) for message in turns]
+        total = sum(self._message_tokens(message) for message in pinned) + sum(counts)
+
+        evicted = []
+        while len(turns) > 1 and (
+            len(turns) > self.max_history * 2  # 保留 max_history 轮对话
+            or (self.history_token_budget is not None and total > self.history_token_budget)
+        ):
+            size = self._oldest_turn_size(turns)
+            evicted.extend(turns[:size])
+            total -= sum(counts[:size])
+            turns, counts = turns[size:], counts[size:]
+
+        if not evicted:
+            return
+        self.message_history = pinned + turns
+        if self.summarizer is not None:
+            self._update_summary(evicted)
+
+    @staticmethod
+    def _oldest_turn_size(turns: List[Dict]) -> int:
+        """最早一轮的消息数：从开头到下一条用户消息之前，至少保留最后一条消息"""
+        size = 1
+        while size < len(turns) - 1 and turns[size]["role"] != "user":
+            size += 1
+        return size
+
+    def _message_tokens(self, message: Dict) -> int:
+        # 每条消息额外计入少量角色/格式开销
+        return self.token_counter(message.get("content", "")) + 4
+
+    def _update_summary(self, evicted: List[Dict]):
+        """把被淘汰的消息合并进摘要，摘要作为一条系统消息固定在系统提示之后"""
+        try:
+            self.history_summary = self.summarizer(self.history_summary, evicted)
+        except Exception as e:
+            print(f"历史摘要生成失败：{str(e)}")
+            return
+        content = f"此前对话摘要：\n{self.history_summary}"
+        if self._summary_message is None:
+            self._summary_message = {"role": "system", "content": content}
+            self.message_history.insert(1 + (self._static_message is not None), self._summary_message)
+        else:
+            self._summary_message["content"] = content
+
+    def _summarize_with_llm(self, previous_summary: str, evicted: List[Dict]) -> str:
+        """默认的摘要函数：调用当前模型把已有摘要和被淘汰的消息压缩成一段短摘要"""
+        transcript = "\n".join(
+            f"{message['role']}: {message.get('content', '')[:2000]}" for message in evicted
+        )
+        prompt = (
+            f"已有摘要：\n{previous_summary or '无'}\n\n"
+            f"需要合并的对话：\n{transcript}\n\n"
+            "请用不超过200字概括以上内容中对后续对话有用的信息（结论、约定、已尝试过的方案），只输出摘要。"
+        )
+        response = self.client.generate(
+            model_name=self.model_name,
+            prompt=self._standalone_prompt(prompt),
+            max_tokens=300,
+            temperature=0.2
+        )
+        return response.strip()
 
-    def _format_history_to_text(self) -> str:
+    def _format_history_to_text(self, messages: Optional[List[Dict]] = None) -> str:
         """将消息历史格式化为纯文本（适用于非 message 格式的模型）"""
         formatted = []
-        for msg in self.message_history:
+        for msg in messages if messages is not None else self.message_history:
             if msg["role"] == "system":
                 formatted.append(f"System: {msg['content']}")
             else:
@@ -102,9 +380,13 @@ class AIAgent:
         return "\n".join(formatted)
 
     def reset(self):
-        """重置对话历史（保留系统提示）"""
+        """重置对话历史（保留系统提示和静态上下文）"""
         self.message_history = []
+        self.history_summary = ""
+        self._summary_message = None
         self._add_system_prompt()
+        if self._static_message is not None:
+            self.message_history.append(self._static_message)
 
 # ===== 使用示例 =====
 if __name__ == "__main__":
@@ -0,0 +1,152 @@
+from unified_llm_client import UnifiedLLMClient
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple, Union
+import asyncio
+import time
+
+try:
+    import aiohttp
+except ImportError:  # 只有使用异步客户端时才需要 aiohttp
+    aiohttp = None
+
+
+@dataclass
+class _LoopResources:
+    """
+    一个事件循环内使用的连接池和同步原语
+    ClientSession、Semaphore、Lock 都绑定在创建它们的事件循环上，不能跨 asyncio.run() 复用
+    """
+    session: Optional["aiohttp.ClientSession"] = None
+    semaphores: Dict[str, asyncio.Semaphore] = field(default_factory=dict)
+    rate_locks: Dict[str, asyncio.Lock] = field(default_factory=dict)
+
+
+class AsyncUnifiedLLMClient:
+    def __init__(
+        self,
+        client: UnifiedLLMClient,
+        max_concurrency: int = 4,
+        requests_per_second: Optional[float] = None,
+        pool_size: int = 100
+    ):
+        """
+        基于 aiohttp 的异步生成客户端，复用 UnifiedLLMClient 中已配置的模型
+        每个模型有独立的并发上限和速率限制，模型配置中的 "max_concurrency" /
+        "requests_per_second" 可覆盖这里的默认值
+        :param client: 已配置好模型的 UnifiedLLMClient 实例
+        :param max_concurrency: 每个模型默认的最大并发请求数
+        :param requests_per_second: 每个模型默认的最大请求速率，None 表示不限速
+        :param pool_size: 连接池的最大连接数（所有模型共享）
+        """
+        if aiohttp is None:
+            raise RuntimeError("AsyncUnifiedLLMClient 需要 aiohttp，请先执行 pip install aiohttp")
+        self.client = client
+        self.logger = client.logger
+        self.file_logger = client.file_logger
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.pool_size = pool_size
+        # 按事件循环分别保存，同步代码中多次 asyncio.run()（如多次 achat）时各自创建
+        self._loop_resources: Dict[asyncio.AbstractEventLoop, _LoopResources] = {}
+        self._next_slot: Dict[str, float] = {}  # 模型下一次允许发送请求的时间
+
+    async def __aenter__(self) -> "AsyncUnifiedLLMClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        """关闭当前事件循环中的连接池（应在结束事件循环前调用，或使用 async with）"""
+        resources = self._loop_resources.pop(asyncio.get_running_loop(), None)
+        if resources is not None and resources.session is not None:
+            await resources.session.close()
+
+    def _resources(self) -> _LoopResources:
+        """当前事件循环的连接池和同步原语"""
+        loop = asyncio.get_running_loop()
+        resources = self._loop_resources.get(loop)
+        if resources is None:
+            # 丢弃已结束的事件循环留下的对象（它们已无法在其他循环中使用）
+            for stale in [other for other in self._loop_resources if other.is_closed()]:
+                del self._loop_resources[stale]
+            resources = _LoopResources()
+            self._loop_resources[loop] = resources
+        return resources
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        """在当前事件循环中创建共享的 ClientSession"""
+        resources = self._resources()
+        if resources.session is None or resources.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            resources.session = aiohttp.ClientSession(connector=connector)
+        return resources.session
+
+    def _get_semaphore(self, model_name: str, config: Dict) -> asyncio.Semaphore:
+        """获取模型在当前事件循环中的并发信号量"""
+        semaphores = self._resources().semaphores
+        semaphore = semaphores.get(model_name)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(config.get("max_concurrency", self.max_concurrency))
+            semaphores[model_name] = semaphore
+        return semaphore
+
+    async def _wait_for_rate_limit(self, model_name: str, config: Dict):
+        """按模型的请求速率限制等待发送时机"""
+        rate = config.get("requests_per_second", self.requests_per_second)
+        if not rate:
+            return
+        lock = self._resources().rate_locks.setdefault(model_name, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(model_name, now))
+            self._next_slot[model_name] = slot + 1.0 / rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def agenerate(
+        self,
+        model_name: str,
+        prompt,
+        max_tokens: int = 100,
+        temperature: float = 0.7,
+        timeout: Optional[Union[float, Tuple[float, float]]] = None,
+        **kwargs
+    ) -> str:
+        """
+        异步统一生成接口，参数同 UnifiedLLMClient.generate()
+        """
+        config, endpoint, data = self.client._build_request(
+            model_name, prompt, max_tokens, temperature, **kwargs
+        )
+        if timeout is None:
+            timeout = self.client._get_timeout(config)
+        if isinstance(timeout, (int, float)):
+            timeout = (self.client.timeout[0], float(timeout))
+        client_timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+
+        async with self._get_semaphore(model_name, config):
+            await self._wait_for_rate_limit(model_name, config)
+            start_time = time.time()
+            try:
+                async with self._get_session().post(
+                    endpoint,
+                    headers=config["headers"],
+                    json=data,
+                    timeout=client_timeout
+                ) as response:
+                    response.raise_for_status()
+                    response_json = await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                elapsed_time = time.time() - start_time
+                self.file_logger.error(f"异步请求失败，耗时：{elapsed_time:.2f}秒")
+                self.file_logger.error(f"错误信息: {str(e)}")
+                self.logger.error(f"生成失败：{str(e)}")
+                raise RuntimeError(f"请求失败: {str(e)}")
+
+        result = self.client._extract_response(response_json, config['response_field'])
+        elapsed_time = time.time() - start_time
+        self.file_logger.info(f"异步生成完成（{model_name}），耗时：{elapsed_time:.2f}秒")
+        self.file_logger.info("生成结果:")
+        self.file_logger.info(result)
+        return result
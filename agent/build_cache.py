@@ -0,0 +1,156 @@
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+DEFAULT_BUILD_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "simpleagent", "build")
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+@lru_cache(maxsize=None)
+def compiler_version(compiler: str) -> str:
+    """返回编译器的版本信息（进程内缓存），获取失败时返回编译器名称"""
+    try:
+        result = subprocess.run([compiler, '--version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return result.stdout.decode(errors='replace').strip()
+    except OSError:
+        return compiler
+
+
+class BuildCache:
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_entries: Optional[int] = DEFAULT_MAX_ENTRIES,
+        max_bytes: Optional[int] = DEFAULT_MAX_BYTES
+    ):
+        """
+        内容寻址的编译缓存：按源码哈希、编译器版本和编译参数缓存可执行文件和编译输出
+        编译失败的结果（诊断信息）同样会被缓存
+        :param cache_dir: 缓存目录，默认为 ~/.cache/simpleagent/build
+        :param max_entries: 最多保留的条目数，超出时淘汰最久未访问的条目，None 表示不限制
+        :param max_bytes: 缓存目录的总大小上限（字节），超出时同样按最久未访问淘汰，None 表示不限制
+        """
+        self.cache_dir = cache_dir or DEFAULT_BUILD_CACHE_DIR
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._prune_lock = threading.Lock()
+
+    def make_key(self, source_paths: List[str], compiler: str, flags: List[str]) -> str:
+        """
+        生成缓存键
+        :param source_paths: 参与编译的源文件（内容计入哈希，路径不计入）
+        :param compiler: 编译器命令
+        :param flags: 编译参数（不含源文件和输出路径）
+        """
+        digest = hashlib.sha256()
+        digest.update(compiler_version(compiler).encode('utf-8'))
+        digest.update(json.dumps(flags).encode('utf-8'))
+        for path in source_paths:
+            with open(path, 'rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+        return digest.hexdigest()
+
+    def lookup(self, key: str, executable_path: Optional[str] = None) -> Optional[Tuple[int, str]]:
+        """
+        查找缓存，命中时把缓存的可执行文件复制到 executable_path
+        :return: (编译返回码, 编译输出)，未命中时返回 None
+        """
+        entry_dir = os.path.join(self.cache_dir, key[:2], key)
+        try:
+            with open(os.path.join(entry_dir, "result.json"), 'r', encoding='utf-8') as f:
+                result = json.load(f)
+            if result["returncode"] == 0 and executable_path:
+                copy_executable(os.path.join(entry_dir, "binary"), executable_path)
+            # 条目目录的修改时间记录最近一次访问，用于 LRU 淘汰
+            os.utime(entry_dir)
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result["returncode"], result["output"]
+
+    def store(self, key: str, returncode: int, output: str, executable_path: Optional[str] = None):
+        """
+        保存编译结果，先写入临时目录再整体重命名，避免并发写入时读到不完整的条目
+        """
+        entry_dir = os.path.join(self.cache_dir, key[:2], key)
+        if os.path.exists(entry_dir):
+            return
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(entry_dir), prefix=".tmp-")
+        try:
+            if returncode == 0 and executable_path:
+                shutil.copy2(executable_path, os.path.join(tmp_dir, "binary"))
+            with open(os.path.join(tmp_dir, "result.json"), 'w', encoding='utf-8') as f:
+                json.dump({"returncode": returncode, "output": output}, f, ensure_ascii=False)
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # 其他进程已写入同一条目或写入失败，都不影响本次编译结果
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        self.prune()
+
+    def prune(self):
+        """按最久未访问的顺序删除条目，直到条目数和总大小都不超过上限"""
+        if self.max_entries is None and self.max_bytes is None:
+            return
+        with self._prune_lock:
+            entries = []
+            for shard in os.listdir(self.cache_dir):
+                shard_dir = os.path.join(self.cache_dir, shard)
+                if not os.path.isdir(shard_dir):
+                    continue
+                for name in os.listdir(shard_dir):
+                    if name.startswith(".tmp-"):
+                        continue
+                    entry_dir = os.path.join(shard_dir, name)
+                    try:
+                        entries.append((os.stat(entry_dir).st_mtime, _dir_size(entry_dir), entry_dir))
+                    except OSError:
+                        continue
+
+            entries.sort()
+            count = len(entries)
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry_dir in entries:
+                if (self.max_entries is None or count <= self.max_entries) and \
+                        (self.max_bytes is None or total <= self.max_bytes):
+                    break
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                count -= 1
+                total -= size
+
+
+def _dir_size(path: str) -> int:
+    """目录下所有文件的总大小"""
+    total = 0
+    for name in os.listdir(path):
+        try:
+            total += os.path.getsize(os.path.join(path, name))
+        except OSError:
+            continue
+    return total
+
+
+def copy_executable(source: str, destination: str):
+    """复制可执行文件：先写临时文件再替换，避免正在运行的旧文件被截断"""
+    destination_dir = os.path.dirname(os.path.abspath(destination))
+    fd, tmp_path = tempfile.mkstemp(dir=destination_dir, prefix=".tmp-")
+    os.close(fd)
+    try:
+        shutil.copy2(source, tmp_path)
+        os.replace(tmp_path, destination)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,126 @@
+import re
+from typing import List
+
+from token_counter import estimate_tokens, _CJK_RANGES
+
+_HEADING_PATTERN = re.compile(r'^#{1,6}\s+\S')
+_FENCE_PATTERN = re.compile(r'^\s*(```|~~~)')
+# 切分窗口时的最小单位：单个中日韩字符、连续非空白串或空白串
+_UNIT_PATTERN = re.compile(rf'[{_CJK_RANGES}]|[^\s{_CJK_RANGES}]+|\s+')
+
+
+def split_markdown(text: str, chunk_size: int = 512, overlap: int = 64) -> List[str]:
+    """
+    将 markdown 文本切分为不超过 chunk_size 个 token 的片段
+    先按标题切分小节，小节过长时按段落打包，单个段落仍过长时按 token 窗口（带重叠）切分。
+    代码块不会从中间断开，除非代码块本身超过 chunk_size。
+    :param text: markdown 文本
+    :param chunk_size: 每个片段的最大 token 数，<= 0 表示不切分
+    :param overlap: token 窗口切分时相邻片段的重叠 token 数
+    :return: 片段列表
+    """
+    if not text.strip():
+        return []
+    if chunk_size <= 0 or estimate_tokens(text) <= chunk_size:
+        return [text.strip()]
+
+    chunks = []
+    for heading, body in _split_sections(text):
+        section = f"{heading}\n{body}".strip() if heading else body.strip()
+        if not section:
+            continue
+        if estimate_tokens(section) <= chunk_size:
+            chunks.append(section)
+            continue
+
+        # 小节过长：每个片段都带上标题，便于检索和阅读
+        prefix = f"{heading}\n" if heading else ""
+        budget = max(chunk_size - estimate_tokens(prefix), 1)
+        current = []
+        current_tokens = 0
+        for paragraph in _split_paragraphs(body):
+            tokens = estimate_tokens(paragraph)
+            if current and current_tokens + tokens > budget:
+                chunks.append(prefix + "\n\n".join(current))
+                current, current_tokens = [], 0
+            if tokens > budget:
+                chunks.extend(prefix + window for window in _split_windows(paragraph, budget, overlap))
+                continue
+            current.append(paragraph)
+            current_tokens += tokens
+        if current:
+            chunks.append(prefix + "\n\n".join(current))
+    return _merge_small(chunks, chunk_size)
+
+
+def _merge_small(chunks: List[str], chunk_size: int) -> List[str]:
+    """合并相邻的短片段（如只有标题的小节），避免产生过碎的片段"""
+    merged = []
+    for chunk in chunks:
+        if merged and estimate_tokens(merged[-1]) + estimate_tokens(chunk) <= chunk_size:
+            merged[-1] = f"{merged[-1]}\n\n{chunk}"
+        else:
+            merged.append(chunk)
+    return merged
+
+
+def _split_sections(text: str) -> List[tuple]:
+    """按 markdown 标题切分，返回 (标题行, 正文) 列表，忽略代码块中的 # 行"""
+    sections = []
+    heading, lines = "", []
+    in_fence = False
+    for line in text.splitlines():
+        if _FENCE_PATTERN.match(line):
+            in_fence = not in_fence
+        elif not in_fence and _HEADING_PATTERN.match(line):
+            sections.append((heading, "\n".join(lines)))
+            heading, lines = line.strip(), []
+            continue
+        lines.append(line)
+    sections.append((heading, "\n".join(lines)))
+    return sections
+
+
+def _split_paragraphs(text: str) -> List[str]:
+    """按空行切分段落，代码块作为一个整体"""
+    paragraphs, lines = [], []
+    in_fence = False
+    for line in text.splitlines():
+        if _FENCE_PATTERN.match(line):
+            in_fence = not in_fence
+        if not in_fence and not line.strip():
+            if lines:
+                paragraphs.append("\n".join(lines))
+                lines = []
+            continue
+        lines.append(line)
+    if lines:
+        paragraphs.append("\n".join(lines))
+    return paragraphs
+
+
+def _split_windows(text: str, size: int, overlap: int) -> List[str]:
+    """按 token 窗口切分，相邻窗口重叠 overlap 个 token"""
+    units = _UNIT_PATTERN.findall(text)
+    unit_tokens = [estimate_tokens(unit) if not unit.isspace() else 0 for unit in units]
+    overlap = min(max(overlap, 0), size // 2)
+
+    windows = []
+    start = 0
+    while start < len(units):
+        end, tokens = start, 0
+        while end < len(units) and (tokens + unit_tokens[end] <= size or end == start):
+            tokens += unit_tokens[end]
+            end += 1
+        window = "".join(units[start:end]).strip()
+        if window:
+            windows.append(window)
+        if end >= len(units):
+            break
+        # 回退 overlap 个 token 作为下一个窗口的起点
+        next_start, back = end, 0
+        while next_start > start + 1 and back + unit_tokens[next_start - 1] <= overlap:
+            next_start -= 1
+            back += unit_tokens[next_start]
+        start = next_start
+    return windows
@@ -0,0 +1,255 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import json
+
+from token_counter import estimate_tokens
+
+# 诊断级别的排序优先级，数值越小越靠前
+_LEVEL_PRIORITY = {
+    "error: internal compiler error": 0,
+    "fatal error": 0,
+    "error": 1,
+    "warning": 2,
+    "note": 3,
+    "help": 3
+}
+# 不携带有效信息的汇总类消息
+_NOISE_PREFIXES = ("aborting due to", "For more information about", "Some errors have detailed explanations")
+
+
+@dataclass
+class Diagnostic:
+    """
+    一条结构化的编译诊断
+    :param level: 级别（error / warning / note ...）
+    :param message: 主消息
+    :param code: 错误码（如 E0308）或 GCC 警告选项
+    :param file: 主位置所在文件
+    :param line: 主位置行号
+    :param column: 主位置列号
+    :param label: 主位置上的说明
+    :param snippet: 主位置对应的源码行
+    :param highlight: (起始列, 结束列)，用于在源码行下标出错误范围
+    :param notes: 附加说明（note / help，包含修改建议）
+    :param duplicates: 被合并到本条的相同诊断（其他位置）
+    """
+    level: str
+    message: str
+    code: Optional[str] = None
+    file: Optional[str] = None
+    line: Optional[int] = None
+    column: Optional[int] = None
+    label: Optional[str] = None
+    snippet: Optional[str] = None
+    highlight: Optional[Tuple[int, int]] = None
+    notes: List[str] = field(default_factory=list)
+    duplicates: List["Diagnostic"] = field(default_factory=list)
+
+    @property
+    def is_error(self) -> bool:
+        return _LEVEL_PRIORITY.get(self.level, 3) <= 1
+
+    def dedup_key(self) -> Tuple:
+        return (self.level, self.code, self.file, self.line, self.column, self.message)
+
+    def group_key(self) -> Tuple:
+        """位置不同但错误码、消息和标注都相同的诊断（修改方式相同）合并为一条"""
+        return (self.level, self.code, self.message, self.label)
+
+    def location(self) -> str:
+        location = self.file or ""
+        if self.line is not None:
+            location += f":{self.line}"
+            if self.column is not None:
+                location += f":{self.column}"
+        return location
+
+    def render(self) -> str:
+        """渲染为紧凑的文本，格式接近 rustc 的人类可读输出"""
+        header = f"{self.level}[{self.code}]" if self.code else self.level
+        lines = [f"{header}: {self.message}"]
+        if self.file:
+            lines.append(f"  --> {self.location()}")
+        if self.snippet is not None and self.line is not None:
+            gutter = str(self.line)
+            lines.append(f"  {gutter} | {self.snippet.rstrip()}")
+            marker = ""
+            if self.highlight:
+                start, end = self.highlight
+                marker = " " * max(start - 1, 0) + "^" * max(end - start, 1)
+            if self.label:
+                marker = f"{marker} {self.label}" if marker else self.label
+            if marker:
+                lines.append(f"  {' ' * len(gutter)} | {marker}")
+        elif self.label:
+            lines.append(f"  = {self.label}")
+        for note in self.notes:
+            lines.append(f"  = {note}")
+        if self.duplicates:
+            locations = "、".join(duplicate.location() or "未知位置" for duplicate in self.duplicates)
+            lines.append(f"  （另有 {len(self.duplicates)} 处相同的诊断，需要一并修改：{locations}）")
+        return "\n".join(lines)
+
+
+def parse_rustc_json(output: str) -> List[Diagnostic]:
+    """
+    解析 rustc --error-format=json / cargo --message-format=json 的输出（每行一个 JSON 对象）
+    无法解析的行（如 cargo 的进度信息）会被跳过
+    """
+    diagnostics = []
+    for line in output.splitlines():
+        line = line.strip()
+        if not line.startswith("{"):
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get("reason") == "compiler-message":
+            record = record.get("message", {})
+        if record.get("$message_type", "diagnostic") != "diagnostic" or "level" not in record:
+            continue
+        message = record.get("message", "")
+        if message.startswith(_NOISE_PREFIXES) or record["level"] == "failure-note":
+            continue
+
+        code = (record.get("code") or {}).get("code")
+        diagnostic = Diagnostic(level=record["level"], message=message, code=code)
+        spans = record.get("spans") or []
+        primary = next((span for span in spans if span.get("is_primary")), spans[0] if spans else None)
+        if primary:
+            diagnostic.file = primary.get("file_name")
+            diagnostic.line = primary.get("line_start")
+            diagnostic.column = primary.get("column_start")
+            diagnostic.label = primary.get("label")
+            text = primary.get("text") or []
+            if text:
+                diagnostic.snippet = text[0].get("text", "")
+                diagnostic.highlight = (text[0].get("highlight_start", 1), text[0].get("highlight_end", 1))
+        for span in spans:
+            if span is not primary and span.get("label"):
+                diagnostic.notes.append(f"note: {span['label']}（第 {span.get('line_start')} 行）")
+        for child in record.get("children") or []:
+            note = f"{child.get('level', 'note')}: {child.get('message', '')}"
+            replacements = [
+                span["suggested_replacement"] for span in child.get("spans") or []
+                if span.get("suggested_replacement") is not None
+            ]
+            if replacements:
+                note += "：" + " / ".join(f"`{r}`" for r in replacements[:3])
+            diagnostic.notes.append(note)
+        diagnostics.append(diagnostic)
+    return diagnostics
+
+
+def parse_gcc_json(output: str, source_path: Optional[str] = None) -> List[Diagnostic]:
+    """
+    解析 g++ -fdiagnostics-format=json 的输出（一个 JSON 数组）
+    GCC 的 JSON 不包含源码文本，提供 source_path 时从源文件中读取对应行
+    """
+    start = output.find("[")
+    if start < 0:
+        return []
+    try:
+        records = json.loads(output[start:output.rfind("]") + 1])
+    except ValueError:
+        return []
+
+    source_lines = _read_lines(source_path) if source_path else None
+    diagnostics = []
+    for record in records:
+        diagnostic = Diagnostic(level=record.get("kind", "error"), message=record.get("message", ""),
+                                code=record.get("option"))
+        locations = record.get("locations") or []
+        if locations:
+            caret = locations[0].get("caret", {})
+            finish = locations[0].get("finish", caret)
+            diagnostic.file = caret.get("file")
+            diagnostic.line = caret.get("line")
+            diagnostic.column = caret.get("column")
+            diagnostic.label = locations[0].get("label")
+            if source_lines and diagnostic.line and 0 < diagnostic.line <= len(source_lines):
+                diagnostic.snippet = source_lines[diagnostic.line - 1]
+                if finish.get("line") == diagnostic.line:
+                    diagnostic.highlight = (caret.get("column", 1), finish.get("column", 1) + 1)
+        for child in record.get("children") or []:
+            child_location = ""
+            child_locations = child.get("locations") or []
+            if child_locations:
+                child_location = f"（第 {child_locations[0].get('caret', {}).get('line')} 行）"
+            diagnostic.notes.append(f"{child.get('kind', 'note')}: {child.get('message', '')}{child_location}")
+        diagnostics.append(diagnostic)
+    return diagnostics
+
+
+def rank_diagnostics(diagnostics: List[Diagnostic]) -> List[Diagnostic]:
+    """
+    去重并排序：按 (错误码, 位置, 消息) 去除完全重复的诊断；错误码、消息和标注都相同的诊断在多处出现时
+    合并为第一处，并列出其余位置（标注不同的同类错误，如不同的类型不匹配，保持为独立条目）；
+    错误排在警告之前，同级别保持编译器的输出顺序（靠前的通常是根因，后面的多为连锁错误）
+    """
+    seen = set()
+    grouped: Dict[Tuple, Diagnostic] = {}
+    unique = []
+    for diagnostic in diagnostics:
+        key = diagnostic.dedup_key()
+        if key in seen:
+            continue
+        seen.add(key)
+        group_key = diagnostic.group_key()
+        if group_key in grouped:
+            grouped[group_key].duplicates.append(diagnostic)
+            continue
+        grouped[group_key] = diagnostic
+        unique.append(diagnostic)
+
+    order = {id(diagnostic): index for index, diagnostic in enumerate(unique)}
+    return sorted(unique, key=lambda d: (_LEVEL_PRIORITY.get(d.level, 3), order[id(d)]))
+
+
+def format_diagnostics(diagnostics: List[Diagnostic], token_budget: int = 1500) -> str:
+    """
+    把诊断渲染为适合放入 LLM 提示的文本，总长度不超过 token_budget（至少保留一条）
+    """
+    ranked = rank_diagnostics(diagnostics)
+    parts = []
+    used = 0
+    for diagnostic in ranked:
+        text = diagnostic.render()
+        cost = estimate_tokens(text)
+        if parts and used + cost > token_budget:
+            break
+        parts.append(text)
+        used += cost
+
+    error_count = sum(1 + len(d.duplicates) for d in ranked if d.is_error)
+    warning_count = sum(1 + len(d.duplicates) for d in ranked) - error_count
+    summary = f"共 {error_count} 条错误、{warning_count} 条其他诊断"
+    omitted = len(ranked) - len(parts)
+    if omitted:
+        summary += f"，因长度限制省略 {omitted} 条"
+    return "\n\n".join(parts + [summary])
+
+
+def summarize_compiler_output(output: str, compiler: str, token_budget: int = 1500,
+                              source_path: Optional[str] = None) -> Tuple[List[Diagnostic], str]:
+    """
+    解析编译器的 JSON 诊断输出并生成精简文本
+    :param compiler: "rustc" / "cargo" / "g++"
+    :return: (诊断列表, 文本)；没有解析到任何诊断时原样返回输出（如链接错误、cargo 配置错误）
+    """
+    if compiler == "g++":
+        diagnostics = parse_gcc_json(output, source_path)
+    else:
+        diagnostics = parse_rustc_json(output)
+    if not diagnostics:
+        return [], output
+    return diagnostics, format_diagnostics(diagnostics, token_budget)
+
+
+def _read_lines(path: str) -> Optional[List[str]]:
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read().splitlines()
+    except OSError:
+        return None
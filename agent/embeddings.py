@@ -1,59 +1,240 @@
 import numpy as np
-from typing import List, Dict
+import scipy.sparse as sp
+import json
+import os
+import pickle
+from typing import List, Dict, Iterable, Tuple, Union
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from chunking import split_markdown
 
 class EmbeddingEngine:
-    def __init__(self, model_name: str = None):
+    def __init__(self, model_name: str = None, refit_ratio: float = 0.5):
         """
         初始化embedding引擎，使用 TF-IDF 作为本地 embedding 方案
+        :param refit_ratio: 自上次拟合后新增文档数超过已拟合文档数的该比例时自动重新拟合词表，
+                            设为 None 则只在调用 refit() 时重新拟合
         """
+        # TF-IDF 默认做 L2 归一化，矩阵乘积即为余弦相似度
         self.vectorizer = TfidfVectorizer()
-        self.document_embeddings: Dict[str, np.ndarray] = {}
-        self.documents: Dict[str, str] = {}
+        # 索引的基本单位是片段（chunk），片段 id 形如 "{doc_id}#{序号}"
+        self.documents: Dict[str, str] = {}          # 片段 id -> 片段内容
+        self.chunk_sources: Dict[str, str] = {}      # 片段 id -> 来源文档 id
+        self.source_chunks: Dict[str, List[str]] = {}  # 来源文档 id -> 片段 id 列表
+        self.doc_ids: List[str] = []          # 片段 id，与 embedding_matrix 的行一一对应
+        self.embedding_matrix: sp.csr_matrix = None
         self.fitted = False
-    
-    def add_document(self, doc_id: str, content: str, chunk_size: int = 512):
-        """
-        添加文档并生成embedding
-        """
-        # 存储文档
-        self.documents[doc_id] = content
-        
-        # 如果已有文档，重新计算所有文档的 embeddings
-        if self.documents:
-            docs = list(self.documents.values())
-            # 拟合并转换所有文档
-            if not self.fitted:
-                embeddings = self.vectorizer.fit_transform(docs)
-                self.fitted = True
-            else:
-                embeddings = self.vectorizer.transform(docs)
-            
-            # 更新所有文档的 embeddings
-            for idx, doc_id in enumerate(self.documents.keys()):
-                self.document_embeddings[doc_id] = embeddings[idx]
-    
-    def search(self, query: str, top_k: int = 3) -> List[Dict]:
+        self.refit_ratio = refit_ratio
+        self._fitted_count = 0   # 上次拟合词表时的文档数
+        self._pending_count = 0  # 上次拟合后追加的文档数（仅用已有词表向量化）
+
+    def add_document(self, doc_id: str, content: str, chunk_size: int = 512, chunk_overlap: int = 64):
+        """
+        添加文档，切分为片段并生成embedding（只向量化新片段）
+        """
+        self.add_documents([(doc_id, content)], chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    def add_documents(
+        self,
+        documents: Union[Dict[str, str], Iterable[Tuple[str, str]]],
+        chunk_size: int = 512,
+        chunk_overlap: int = 64
+    ):
         """
-        搜索相关文档
+        批量添加文档，一次性完成向量化
+        :param documents: {doc_id: content} 或 (doc_id, content) 序列
+        :param chunk_size: 每个片段的最大 token 数，<= 0 表示整篇文档作为一个片段
+        :param chunk_overlap: 长段落按窗口切分时的重叠 token 数
+        """
+        items = list(documents.items()) if isinstance(documents, dict) else list(documents)
+        if not items:
+            return
+
+        # 覆盖已有文档时行号会变化，直接走重新拟合
+        replaced = False
+        new_ids = []
+        for doc_id, content in items:
+            if doc_id in self.source_chunks:
+                self._drop_chunks(doc_id)
+                replaced = True
+            chunk_ids = []
+            for idx, chunk in enumerate(split_markdown(content, chunk_size, chunk_overlap)):
+                chunk_id = f"{doc_id}#{idx}"
+                self.documents[chunk_id] = chunk
+                self.chunk_sources[chunk_id] = doc_id
+                chunk_ids.append(chunk_id)
+            self.source_chunks[doc_id] = chunk_ids
+            new_ids.extend(chunk_ids)
+        new_ids = list(dict.fromkeys(new_ids))
+
+        # 首次添加或新增片段过多时重新拟合词表，否则只向量化新增内容
+        if not self.fitted or replaced or self._needs_refit(len(new_ids)):
+            self.refit()
+            return
+        if not new_ids:
+            return
+
+        embeddings = self.vectorizer.transform([self.documents[chunk_id] for chunk_id in new_ids])
+        self.embedding_matrix = sp.vstack([self.embedding_matrix, embeddings], format='csr')
+        self.doc_ids.extend(new_ids)
+        self._pending_count += len(new_ids)
+
+    def remove_documents(self, doc_ids: Iterable[str]):
+        """
+        删除文档及其全部片段，只删除矩阵中对应的行，不重新拟合词表
+        """
+        removed = set()
+        for doc_id in doc_ids:
+            removed.update(self.source_chunks.get(doc_id, []))
+            self._drop_chunks(doc_id)
+        if not removed or self.embedding_matrix is None:
+            return
+
+        keep = [idx for idx, chunk_id in enumerate(self.doc_ids) if chunk_id not in removed]
+        self.embedding_matrix = sp.csr_matrix(self.embedding_matrix[keep])
+        self.doc_ids = [self.doc_ids[idx] for idx in keep]
+        # 删除也会让 idf 偏离，计入待重新拟合的变更数
+        self._pending_count += len(removed)
+
+    def _drop_chunks(self, doc_id: str):
+        """删除文档的所有片段内容（不修改矩阵，调用方负责重建）"""
+        for chunk_id in self.source_chunks.pop(doc_id, []):
+            self.documents.pop(chunk_id, None)
+            self.chunk_sources.pop(chunk_id, None)
+
+    def _needs_refit(self, new_count: int) -> bool:
+        """判断追加 new_count 篇文档后是否需要重新拟合词表"""
+        if self.refit_ratio is None:
+            return False
+        return self._pending_count + new_count > self._fitted_count * self.refit_ratio
+
+    def refit(self):
+        """
+        基于全部文档重新拟合词表并重新计算所有 embeddings
         """
         if not self.documents:
-            return []
-        
-        # 将查询转换为向量
-        query_vector = self.vectorizer.transform([query])
-        
+            self.doc_ids = []
+            self.embedding_matrix = None
+            self.fitted = False
+            return
+        self.doc_ids = list(self.documents.keys())
+        self.embedding_matrix = sp.csr_matrix(
+            self.vectorizer.fit_transform([self.documents[doc_id] for doc_id in self.doc_ids])
+        )
+        self.fitted = True
+        self._fitted_count = len(self.doc_ids)
+        self._pending_count = 0
+
+    def search(self, query: str, top_k: int = 3) -> List[Dict]:
+        """
+        搜索相关片段
+        :return: [{'doc_id': 来源文档, 'chunk_id': 片段 id, 'content': 片段内容, 'score': 相似度}]
+        """
+        return self.search_many([query], top_k)[0]
+
+    def search_many(self, queries: List[str], top_k: int = 3) -> List[List[Dict]]:
+        """
+        批量搜索，一次矩阵乘积完成所有查询的打分
+        :return: 与 queries 顺序对应的结果列表
+        """
+        if not self.doc_ids or not queries:
+            return [[] for _ in queries]
+
+        # (文档数 x 查询数) 的相似度矩阵
+        query_matrix = self.vectorizer.transform(queries)
+        scores = (self.embedding_matrix @ query_matrix.T).toarray()
+
+        k = min(top_k, len(self.doc_ids))
+        if k <= 0:
+            return [[] for _ in queries]
+        return [self._top_k(scores[:, col], k) for col in range(scores.shape[1])]
+
+    def _top_k(self, scores: np.ndarray, k: int) -> List[Dict]:
+        """用 argpartition 选出前 k 个，只对这 k 个排序"""
+        if k < len(scores):
+            candidates = np.argpartition(-scores, k - 1)[:k]
+        else:
+            candidates = np.arange(len(scores))
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
         results = []
-        for doc_id, embedding in self.document_embeddings.items():
-            # 计算相似度
-            similarity = cosine_similarity(query_vector, embedding)[0][0]
+        for idx in candidates:
+            chunk_id = self.doc_ids[idx]
             results.append({
-                'doc_id': doc_id,
-                'content': self.documents[doc_id],
-                'score': float(similarity)
+                'doc_id': self.chunk_sources[chunk_id],
+                'chunk_id': chunk_id,
+                'chunk_index': int(chunk_id.rsplit('#', 1)[1]),
+                'content': self.documents[chunk_id],
+                'score': float(scores[idx])
             })
-        
-        # 按相似度排序
-        results.sort(key=lambda x: x['score'], reverse=True)
-        return results[:top_k] 
\ No newline at end of file
+        return results
+
+    def save(self, cache_dir: str):
+        """
+        将词表、稀疏矩阵和片段元数据保存到目录
+        矩阵以 CSR 的三个数组分别保存为 .npy，加载时可直接内存映射
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        # stop_words_ 只用于调试且体积大，不需要持久化
+        if hasattr(self.vectorizer, 'stop_words_'):
+            self.vectorizer.stop_words_ = None
+        _atomic_write(os.path.join(cache_dir, 'vectorizer.pkl'), pickle.dumps(self.vectorizer))
+
+        matrix = self.embedding_matrix
+        if matrix is not None:
+            for name in ('data', 'indices', 'indptr'):
+                path = os.path.join(cache_dir, f'matrix_{name}.npy')
+                with open(path + '.tmp', 'wb') as f:
+                    np.save(f, getattr(matrix, name))
+                os.replace(path + '.tmp', path)
+
+        meta = {
+            'doc_ids': self.doc_ids,
+            'documents': self.documents,
+            'chunk_sources': self.chunk_sources,
+            'source_chunks': self.source_chunks,
+            'shape': list(matrix.shape) if matrix is not None else None,
+            'fitted': self.fitted,
+            'fitted_count': self._fitted_count,
+            'pending_count': self._pending_count
+        }
+        # 元数据最后写入，作为整个索引写入完成的标志
+        _atomic_write(
+            os.path.join(cache_dir, 'chunks.json'),
+            json.dumps(meta, ensure_ascii=False).encode('utf-8')
+        )
+
+    @classmethod
+    def load(cls, cache_dir: str, refit_ratio: float = 0.5, mmap: bool = True) -> 'EmbeddingEngine':
+        """
+        从目录加载 save() 保存的索引
+        :param mmap: 是否以内存映射方式加载矩阵数组
+        """
+        engine = cls(refit_ratio=refit_ratio)
+        with open(os.path.join(cache_dir, 'chunks.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(os.path.join(cache_dir, 'vectorizer.pkl'), 'rb') as f:
+            engine.vectorizer = pickle.load(f)
+
+        engine.doc_ids = meta['doc_ids']
+        engine.documents = meta['documents']
+        engine.chunk_sources = meta['chunk_sources']
+        engine.source_chunks = meta['source_chunks']
+        engine.fitted = meta['fitted']
+        engine._fitted_count = meta['fitted_count']
+        engine._pending_count = meta['pending_count']
+        if meta['shape'] is not None:
+            mmap_mode = 'r' if mmap else None
+            arrays = [
+                np.load(os.path.join(cache_dir, f'matrix_{name}.npy'), mmap_mode=mmap_mode)
+                for name in ('data', 'indices', 'indptr')
+            ]
+            engine.embedding_matrix = sp.csr_matrix(tuple(arrays), shape=tuple(meta['shape']), copy=False)
+            if engine.embedding_matrix.shape[0] != len(engine.doc_ids):
+                raise ValueError("索引矩阵与片段元数据不一致")
+        return engine
+
+
+def _atomic_write(path: str, data: bytes):
+    """先写临时文件再替换，避免中途失败留下损坏的文件"""
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
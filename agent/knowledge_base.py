@@ -0,0 +1,240 @@
+from embeddings import EmbeddingEngine
+from typing import List, Dict, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import threading
+
+# 索引格式变化时递增，旧缓存会被整体重建
+INDEX_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+
+class KnowledgeBase:
+    def __init__(
+        self,
+        knowledge_base_path: str,
+        embedding_model: Optional[str] = None,
+        chunk_size: int = 512,
+        chunk_overlap: int = 64,
+        cache_dir: Optional[str] = None,
+        extensions: Tuple[str, ...] = ('.md', '.txt')
+    ):
+        """
+        知识库索引：扫描目录、切分并向量化文档，并把索引持久化到缓存目录
+        :param knowledge_base_path: 知识库目录路径
+        :param embedding_model: 使用的embedding模型名称
+        :param chunk_size: 文档切分的片段大小（token 数）
+        :param chunk_overlap: 长段落切分时相邻片段的重叠 token 数
+        :param cache_dir: 索引缓存目录，默认为知识库目录下的 .index_cache；
+                          知识库路径为空时不做持久化
+        :param extensions: 需要索引的文件后缀
+        """
+        self.knowledge_base_path = knowledge_base_path
+        self.embedding_model = embedding_model
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.extensions = extensions
+        if cache_dir is None and knowledge_base_path:
+            cache_dir = os.path.join(knowledge_base_path, ".index_cache")
+        self.cache_dir = cache_dir
+        self.engine = EmbeddingEngine(embedding_model)
+        # 文件路径 -> {"mtime": ..., "size": ..., "sha256": ...}
+        self.file_states: Dict[str, Dict] = {}
+
+    def load(self):
+        """
+        加载知识库索引
+        优先读取缓存，只重新索引 mtime/大小变化且内容哈希也变化的文件，
+        新增文件追加索引，已删除文件从索引中移除
+        """
+        if self._load_cache():
+            current = self._scan_files()
+            changed, removed = self._diff_files(current)
+        else:
+            self.engine = EmbeddingEngine(self.embedding_model)
+            self.file_states = {}
+            current = self._scan_files()
+            changed, removed = list(current.keys()), []
+
+        if changed or removed:
+            self.engine.remove_documents(removed + [path for path in changed if path in self.file_states])
+            documents = {}
+            for path in changed:
+                documents[path] = self._read_file(path)
+                current[path]["sha256"] = hashlib.sha256(documents[path].encode('utf-8')).hexdigest()
+            self.engine.add_documents(
+                documents,
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap
+            )
+            logger.info(f"知识库索引更新：{len(changed)} 个文件重新索引，{len(removed)} 个文件移除")
+        elif self.file_states == current:
+            return
+        self.file_states = current
+        self._save_cache()
+
+    def search(self, query: str, top_k: int = 3) -> List[Dict]:
+        """检索相关片段"""
+        return self.engine.search(query, top_k)
+
+    def _scan_files(self) -> Dict[str, Dict]:
+        """遍历知识库目录，收集文件的 mtime 和大小"""
+        states = {}
+        if not self.knowledge_base_path:
+            return states
+        for root, dirs, files in os.walk(self.knowledge_base_path):
+            # 跳过隐藏目录（包括索引缓存目录）
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            for file in sorted(files):
+                if file.endswith(self.extensions):
+                    file_path = os.path.join(root, file)
+                    stat = os.stat(file_path)
+                    states[file_path] = {"mtime": stat.st_mtime_ns, "size": stat.st_size}
+        return states
+
+    def _diff_files(self, current: Dict[str, Dict]) -> Tuple[List[str], List[str]]:
+        """
+        对比缓存中的文件状态，返回 (需要重新索引的文件, 已删除的文件)
+        mtime 或大小变化时再比较内容哈希，内容未变的文件不重新索引
+        """
+        changed = []
+        for path, state in current.items():
+            cached = self.file_states.get(path)
+            if cached is None:
+                changed.append(path)
+                continue
+            if cached["mtime"] == state["mtime"] and cached["size"] == state["size"]:
+                state["sha256"] = cached.get("sha256")
+                continue
+            digest = hashlib.sha256(self._read_file(path).encode('utf-8')).hexdigest()
+            if digest == cached.get("sha256"):
+                state["sha256"] = digest
+            else:
+                changed.append(path)
+        removed = [path for path in self.file_states if path not in current]
+        return changed, removed
+
+    def _read_file(self, path: str) -> str:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def _cache_config(self) -> Dict:
+        """影响索引内容的配置，任何一项变化都需要重建索引"""
+        return {
+            "version": INDEX_VERSION,
+            "embedding_model": self.embedding_model,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap
+        }
+
+    def _load_cache(self) -> bool:
+        """读取缓存，缓存不存在、配置不一致或损坏时返回 False"""
+        if not self.cache_dir:
+            return False
+        manifest_path = os.path.join(self.cache_dir, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return False
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get("config") != self._cache_config():
+                return False
+            self.engine = EmbeddingEngine.load(self.cache_dir)
+            self.file_states = manifest["files"]
+            return True
+        except Exception as e:
+            logger.warning(f"知识库索引缓存不可用，将重新建立索引：{str(e)}")
+            return False
+
+    def _save_cache(self):
+        """保存索引和文件清单，失败时只记录日志"""
+        if not self.cache_dir:
+            return
+        try:
+            self.engine.save(self.cache_dir)
+            manifest_path = os.path.join(self.cache_dir, "manifest.json")
+            with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({"config": self._cache_config(), "files": self.file_states}, f, ensure_ascii=False)
+            os.replace(manifest_path + '.tmp', manifest_path)
+        except OSError as e:
+            logger.warning(f"保存知识库索引缓存失败：{str(e)}")
+
+
+class KnowledgeBaseRegistry:
+    def __init__(self):
+        """
+        共享知识库索引的注册表，按知识库路径和 embedding 配置复用同一个 KnowledgeBase，
+        并用引用计数在最后一个使用者释放后回收
+        """
+        self._entries: Dict[Tuple, List] = {}  # key -> [KnowledgeBase, 引用计数]
+        self._lock = threading.Lock()
+
+    def _make_key(
+        self,
+        knowledge_base_path: str,
+        embedding_model: Optional[str],
+        chunk_size: int,
+        chunk_overlap: int,
+        cache_dir: Optional[str]
+    ) -> Tuple:
+        return (
+            os.path.abspath(knowledge_base_path) if knowledge_base_path else "",
+            embedding_model,
+            chunk_size,
+            chunk_overlap,
+            os.path.abspath(cache_dir) if cache_dir else None
+        )
+
+    def acquire(
+        self,
+        knowledge_base_path: str,
+        embedding_model: Optional[str] = None,
+        chunk_size: int = 512,
+        chunk_overlap: int = 64,
+        cache_dir: Optional[str] = None
+    ) -> KnowledgeBase:
+        """
+        获取（必要时创建并加载）共享的知识库索引，引用计数加一
+        参数含义同 KnowledgeBase
+        """
+        key = self._make_key(knowledge_base_path, embedding_model, chunk_size, chunk_overlap, cache_dir)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                knowledge_base = KnowledgeBase(
+                    knowledge_base_path,
+                    embedding_model=embedding_model,
+                    chunk_size=chunk_size,
+                    chunk_overlap=chunk_overlap,
+                    cache_dir=cache_dir
+                )
+                knowledge_base.load()
+                entry = [knowledge_base, 0]
+                self._entries[key] = entry
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, knowledge_base: KnowledgeBase):
+        """释放一次引用，引用计数归零时从注册表移除"""
+        with self._lock:
+            for key, entry in self._entries.items():
+                if entry[0] is knowledge_base:
+                    entry[1] -= 1
+                    if entry[1] <= 0:
+                        del self._entries[key]
+                    return
+
+    def refcount(self, knowledge_base: KnowledgeBase) -> int:
+        """返回知识库当前的引用计数，未注册时为 0"""
+        with self._lock:
+            for entry in self._entries.values():
+                if entry[0] is knowledge_base:
+                    return entry[1]
+        return 0
+
+
+# 进程内默认共享的注册表
+default_registry = KnowledgeBaseRegistry()
@@ -0,0 +1,68 @@
+from typing import Dict, List
+
+
+class PatchError(ValueError):
+    """补丁无法应用：search 片段不存在或无法唯一定位"""
+
+
+def apply_search_replace(code: str, patches: List[Dict]) -> str:
+    """
+    依次应用 search/replace 补丁
+    每个补丁的 search 片段必须在当前代码中唯一出现；逐字匹配失败时，
+    再忽略每行首尾空白按行匹配（模型复制代码时经常改动缩进）
+    :param code: 当前代码
+    :param patches: [{"search": 原片段, "replace": 新片段}, ...]
+    :return: 应用全部补丁后的代码
+    :raises PatchError: 任意一个补丁无法应用
+    """
+    if not isinstance(patches, list) or not patches:
+        raise PatchError("补丁列表为空")
+    for index, patch in enumerate(patches, 1):
+        if not isinstance(patch, dict):
+            raise PatchError(f"第 {index} 个补丁格式错误")
+        search = patch.get("search")
+        replace = patch.get("replace", "")
+        if not isinstance(search, str) or not search.strip():
+            raise PatchError(f"第 {index} 个补丁缺少 search 片段")
+        if not isinstance(replace, str):
+            raise PatchError(f"第 {index} 个补丁的 replace 不是字符串")
+        code = _apply_one(code, search, replace, index)
+    return code
+
+
+def _apply_one(code: str, search: str, replace: str, index: int) -> str:
+    count = code.count(search)
+    if count == 1:
+        return code.replace(search, replace, 1)
+    if count > 1:
+        raise PatchError(f"第 {index} 个补丁的 search 片段出现了 {count} 次，无法唯一定位")
+
+    # 按行匹配，忽略每行首尾空白
+    code_lines = code.split("\n")
+    search_lines = search.strip("\n").split("\n")
+    stripped_search = [line.strip() for line in search_lines]
+    size = len(search_lines)
+    matches = [
+        start for start in range(len(code_lines) - size + 1)
+        if [line.strip() for line in code_lines[start:start + size]] == stripped_search
+    ]
+    if not matches:
+        raise PatchError(f"第 {index} 个补丁的 search 片段在代码中不存在：\n{search_lines[0].strip()}")
+    if len(matches) > 1:
+        raise PatchError(f"第 {index} 个补丁的 search 片段出现了 {len(matches)} 次，无法唯一定位")
+
+    start = matches[0]
+    replace_lines = replace.strip("\n").split("\n") if replace.strip("\n") else []
+    # 模型给出的缩进与原代码不同时，按第一行的缩进差异整体平移 replace
+    code_indent = _indent(code_lines[start])
+    search_indent = _indent(search_lines[0])
+    if code_indent != search_indent:
+        replace_lines = [
+            code_indent + line[len(search_indent):] if line.startswith(search_indent) else line
+            for line in replace_lines
+        ]
+    return "\n".join(code_lines[:start] + replace_lines + code_lines[start + size:])
+
+
+def _indent(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
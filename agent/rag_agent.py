@@ -1,6 +1,7 @@
 from ai_agent import AIAgent
 from unified_llm_client import UnifiedLLMClient
-from embeddings import EmbeddingEngine
+from knowledge_base import KnowledgeBase, KnowledgeBaseRegistry, default_registry
+from token_counter import estimate_tokens
 from typing import List, Dict, Optional
 import os
 
@@ -12,11 +13,28 @@ class RAGAgent(AIAgent):
         knowledge_base_path: str,
         embedding_model: str = "all-MiniLM-L6-v2",
         system_prompt: Optional[str] = None,
-        max_history: int = 5
+        max_history: int = 5,
+        chunk_size: int = 512,
+        chunk_overlap: int = 64,
+        retrieval_top_k: int = 6,
+        context_token_budget: int = 1500,
+        index_cache_dir: Optional[str] = None,
+        registry: Optional[KnowledgeBaseRegistry] = None,
+        history_token_budget: Optional[int] = None,
+        summarize_evicted: bool = False
     ):
         """
         初始化 RAG Agent
         :param embedding_model: 使用的embedding模型名称
+        :param chunk_size: 知识库文档切分的片段大小（token 数）
+        :param chunk_overlap: 长段落切分时相邻片段的重叠 token 数
+        :param retrieval_top_k: 每次检索召回的片段数
+        :param context_token_budget: 注入提示的参考资料最大 token 数
+        :param index_cache_dir: 知识库索引缓存目录，默认为知识库目录下的 .index_cache
+        :param registry: 共享知识库索引的注册表，默认使用进程内的 default_registry，
+                         相同知识库路径和 embedding 配置的 Agent 共用同一份索引
+        :param history_token_budget: 对话历史的 token 上限，默认取模型配置（见 AIAgent）
+        :param summarize_evicted: 是否把被淘汰的历史轮次压缩为摘要（见 AIAgent）
         """
         default_system_prompt = (
             "你是一个基于知识库的智能助手。请基于提供的相关文档回答问题，"
@@ -34,29 +52,80 @@ class RAGAgent(AIAgent):
             client=client,
             system_prompt=system_prompt or default_system_prompt,
             model_name=model_name,
-            max_history=max_history
+            max_history=max_history,
+            history_token_budget=history_token_budget,
+            summarize_evicted=summarize_evicted
         )
         
         self.knowledge_base_path = knowledge_base_path
-        self.embedding_engine = EmbeddingEngine(embedding_model)
-        self._initialize_knowledge_base()
+        self.retrieval_top_k = retrieval_top_k
+        self.context_token_budget = context_token_budget
+        self.registry = registry or default_registry
+        self.knowledge_base: Optional[KnowledgeBase] = None
+        self._initialize_knowledge_base(embedding_model, chunk_size, chunk_overlap, index_cache_dir)
         
-    def _initialize_knowledge_base(self):
-        """初始化知识库并生成embeddings"""
-        for root, _, files in os.walk(self.knowledge_base_path):
-            for file in files:
-                if file.endswith(('.md', '.txt')):
-                    file_path = os.path.join(root, file)
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        self.embedding_engine.add_document(file_path, content)
+    def _initialize_knowledge_base(
+        self,
+        embedding_model: str,
+        chunk_size: int,
+        chunk_overlap: int,
+        index_cache_dir: Optional[str]
+    ):
+        """从注册表获取共享的知识库索引（首次获取时加载，优先使用缓存）"""
+        self.knowledge_base = self.registry.acquire(
+            self.knowledge_base_path,
+            embedding_model=embedding_model,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            cache_dir=index_cache_dir
+        )
+
+    @property
+    def embedding_engine(self):
+        """当前共享知识库使用的 embedding 引擎"""
+        return self.knowledge_base.engine
+
+    def close(self):
+        """释放对共享知识库索引的引用"""
+        if self.knowledge_base is not None:
+            self.registry.release(self.knowledge_base)
+            self.knowledge_base = None
     
-    def _search_relevant_docs(self, query: str, top_k: int = 2) -> List[Dict]:
-        """使用embedding搜索相关文档"""
-        return self.embedding_engine.search(query, top_k)
+    def _search_relevant_docs(self, query: str, top_k: Optional[int] = None) -> List[Dict]:
+        """使用embedding检索相关片段，并按来源文档合并"""
+        hits = self.knowledge_base.search(query, top_k or self.retrieval_top_k)
+        return self._merge_chunks(hits)
+
+    def _merge_chunks(self, hits: List[Dict]) -> List[Dict]:
+        """
+        在 token 预算内按相似度挑选片段，再按来源文档合并
+        同一文档的片段按原文顺序拼接，文档按最高相似度排序
+        """
+        selected: Dict[str, List[Dict]] = {}
+        used_tokens = 0
+        for hit in hits:
+            tokens = estimate_tokens(hit['content'])
+            if used_tokens + tokens > self.context_token_budget:
+                continue
+            used_tokens += tokens
+            selected.setdefault(hit['doc_id'], []).append(hit)
+
+        merged = []
+        for doc_id, chunks in selected.items():
+            chunks.sort(key=lambda c: c['chunk_index'])
+            merged.append({
+                'doc_id': doc_id,
+                'content': "\n...\n".join(c['content'] for c in chunks),
+                'score': max(c['score'] for c in chunks)
+            })
+        merged.sort(key=lambda d: d['score'], reverse=True)
+        return merged
     
-    def chat(self, user_input: str, **kwargs) -> str:
-        """增强的对话函数，使用embedding检索"""
+    def _augment_input(self, user_input: str) -> str:
+        """
+        检索相关文档并拼接到用户输入之前
+        检索结果只出现在本轮发送的最新消息中，不写入对话历史，历史前缀在多轮之间保持不变
+        """
         # 检索相关文档
         relevant_docs = self._search_relevant_docs(user_input)
         
@@ -73,8 +142,7 @@ class RAGAgent(AIAgent):
             f"用户请求：{user_input}\n\n"
             "请基于以上参考资料回答，并严格按照指定的JSON格式响应。"
         )
-        
-        return super().chat(enhanced_prompt, **kwargs)
+        return enhanced_prompt
 
 # 使用示例
 if __name__ == "__main__":
@@ -95,4 +163,4 @@ if __name__ == "__main__":
     
     # 测试对话
     response = rag_agent.chat("如何将C++代码转换为Rust代码？")
-    print(response) 
\ No newline at end of file
+    print(response) 
\ No newline at end of file
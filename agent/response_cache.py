@@ -0,0 +1,165 @@
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        db_path: Optional[str] = None,
+        ttl: Optional[float] = None,
+        max_db_entries: int = 100000
+    ):
+        """
+        LLM 响应缓存：内存 LRU + 可选的 SQLite 持久化
+        :param max_entries: 内存中最多保留的条目数（LRU 淘汰）
+        :param db_path: SQLite 数据库路径，None 表示只使用内存缓存
+        :param ttl: 条目有效期（秒），None 表示永不过期
+        :param max_db_entries: SQLite 中最多保留的条目数，超出时淘汰最久未访问的条目
+        """
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_db_entries = max_db_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()  # key -> (响应, 写入时间)
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            db_dir = os.path.dirname(db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses (accessed_at)")
+            self._db.commit()
+
+    @staticmethod
+    def make_key(model: str, prompt, temperature: float, max_tokens: int, extra: Optional[Dict] = None) -> str:
+        """
+        根据模型、规范化后的 prompt/messages 和采样参数生成缓存键
+        """
+        payload = {
+            "model": model,
+            "prompt": ResponseCache._normalize_prompt(prompt),
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "extra": extra or {}
+        }
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _normalize_prompt(prompt):
+        """去掉每行行尾和首尾空白，使仅空白不同的 prompt 命中同一条缓存"""
+        def normalize_text(text: str) -> str:
+            return "\n".join(line.rstrip() for line in text.strip().splitlines())
+
+        if isinstance(prompt, str):
+            return normalize_text(prompt)
+        return [
+            {**message, "content": normalize_text(message.get("content", ""))}
+            for message in prompt
+        ]
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，未命中或已过期时返回 None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[1]):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if not self._expired(row[1]):
+                        self._db.execute(
+                            "UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key)
+                        )
+                        self._db.commit()
+                        self._put_memory(key, row[0], row[1])
+                        self.hits += 1
+                        return row[0]
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, response: str):
+        """写入缓存"""
+        now = time.time()
+        with self._lock:
+            self._put_memory(key, response, now)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, response, now, now)
+                )
+                self._evict_db()
+                self._db.commit()
+
+    def _put_memory(self, key: str, response: str, created_at: float):
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_db(self):
+        """删除过期条目，并按最久未访问淘汰超出容量的条目"""
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+        count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_db_entries:
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                (count - self.max_db_entries,)
+            )
+
+    def clear(self):
+        """清空内存和磁盘缓存"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def get_stats(self) -> Dict:
+        """返回命中/未命中计数和命中率"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "memory_entries": len(self._memory)
+            }
+
+    def close(self):
+        """关闭 SQLite 连接"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,278 @@
+from dataclasses import dataclass
+from typing import List, Optional
+import os
+import resource
+import shutil
+import signal
+import subprocess
+import threading
+import time
+
+# 超过 CPU 时间软限制时内核发送 SIGXCPU
+_CPU_LIMIT_SIGNALS = (signal.SIGXCPU,)
+# 内存分配失败时 Rust / C++ 运行时的典型输出
+_OOM_MARKERS = ("memory allocation of", "std::bad_alloc", "Cannot allocate memory", "out of memory")
+# util-linux 的 prlimit：设置 rlimit 后 exec 目标程序，子进程中不需要运行 Python 代码
+_PRLIMIT = shutil.which("prlimit")
+_warned_no_prlimit = False
+
+
+@dataclass
+class ExecutionLimits:
+    """
+    子进程的资源限制
+    :param wall_timeout: 墙钟超时（秒）
+    :param cpu_time: CPU 时间限制（秒，RLIMIT_CPU）
+    :param memory_bytes: 虚拟内存上限（字节，RLIMIT_AS）
+    :param max_processes: 进程/线程数上限（RLIMIT_NPROC），默认不限制：
+                          该限制按用户统计全部进程和线程，并行运行或用户进程较多时会误伤
+    :param max_file_bytes: 单个写入文件的大小上限（字节，RLIMIT_FSIZE）
+    :param max_output_bytes: stdout/stderr 各自最多捕获的字节数，超出时终止进程
+    """
+    wall_timeout: Optional[float] = 10.0
+    cpu_time: Optional[int] = 10
+    memory_bytes: Optional[int] = 1024 * 1024 * 1024
+    max_processes: Optional[int] = None
+    max_file_bytes: Optional[int] = 64 * 1024 * 1024
+    max_output_bytes: int = 1024 * 1024
+
+
+@dataclass
+class ExecutionResult:
+    """
+    子进程的执行结果
+    status 取值：ok / exit（非零退出码）/ timeout / cpu_timeout / oom / signal / output_limit / error
+    """
+    status: str
+    exit_code: Optional[int]
+    signal: Optional[int]
+    stdout: str
+    stderr: str
+    stdout_truncated: bool
+    stderr_truncated: bool
+    duration: float
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+    def describe(self) -> str:
+        """生成简短的状态说明，用于拼接到错误信息中"""
+        if self.status == "ok":
+            return "运行成功"
+        if self.status == "exit":
+            return f"程序以退出码 {self.exit_code} 结束"
+        if self.status == "timeout":
+            return f"运行超时（{self.duration:.1f}秒），进程已被终止"
+        if self.status == "cpu_timeout":
+            return "超过 CPU 时间限制，进程已被终止"
+        if self.status == "oom":
+            return "超过内存限制"
+        if self.status == "signal":
+            name = signal.Signals(self.signal).name if self.signal else "未知信号"
+            return f"程序被信号 {name} 终止"
+        if self.status == "output_limit":
+            return "输出超过上限，进程已被终止"
+        return "执行失败"
+
+    def error_message(self) -> str:
+        """失败时返回给调用方的信息：stderr 加上状态说明"""
+        stderr = self.stderr.rstrip()
+        if stderr:
+            return f"{stderr}\n[{self.describe()}]"
+        return self.describe()
+
+
+def run_sandboxed(
+    cmd: List[str],
+    input_data: Optional[bytes] = None,
+    limits: Optional[ExecutionLimits] = None,
+    cwd: Optional[str] = None
+) -> ExecutionResult:
+    """
+    在资源受限的子进程中运行命令
+    子进程位于独立的进程组，超时或输出超限时整个进程组被 SIGKILL；
+    stdout/stderr 以流的方式读取并截断到上限，不会整体缓存在内存中
+    :param cmd: 命令及参数
+    :param input_data: 写入 stdin 的数据
+    :param limits: 资源限制，默认使用 ExecutionLimits()
+    :param cwd: 工作目录
+    """
+    limits = limits or ExecutionLimits()
+    start_time = time.time()
+    start_cpu = _children_cpu_time()
+    # 经 prlimit 启动时，程序不存在的错误会变成 prlimit 的退出码，这里提前检查
+    executable = cmd[0] if os.path.dirname(cmd[0]) else shutil.which(cmd[0])
+    if not executable or not os.access(os.path.join(cwd or "", executable), os.X_OK):
+        return ExecutionResult("error", None, None, "", f"无法执行：{cmd[0]}", False, False, 0.0)
+    try:
+        # 不使用 preexec_fn：调用方常在线程池中运行，多线程进程 fork 后执行 Python 代码可能死锁
+        process = subprocess.Popen(
+            _limit_command(cmd, limits),
+            stdin=subprocess.PIPE if input_data is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=cwd,
+            start_new_session=True  # 独立进程组，便于整体终止
+        )
+    except OSError as e:
+        return ExecutionResult("error", None, None, "", str(e), False, False, time.time() - start_time)
+
+    output_exceeded = threading.Event()
+    stdout_capture = _StreamCapture(process.stdout, limits.max_output_bytes, output_exceeded)
+    stderr_capture = _StreamCapture(process.stderr, limits.max_output_bytes, output_exceeded)
+    threads = [
+        threading.Thread(target=stdout_capture.run, daemon=True),
+        threading.Thread(target=stderr_capture.run, daemon=True)
+    ]
+    if input_data is not None:
+        threads.append(threading.Thread(target=_feed_stdin, args=(process.stdin, input_data), daemon=True))
+    for thread in threads:
+        thread.start()
+
+    # 轮询等待，期间检查墙钟超时和输出上限
+    timed_out = False
+    deadline = start_time + limits.wall_timeout if limits.wall_timeout else None
+    while process.poll() is None:
+        if output_exceeded.is_set():
+            break
+        if deadline is not None and time.time() >= deadline:
+            timed_out = True
+            break
+        try:
+            process.wait(timeout=0.05)
+        except subprocess.TimeoutExpired:
+            pass
+
+    # 无论是否正常结束，都清理进程组中残留的子进程
+    _kill_process_group(process.pid)
+    process.wait()
+    for thread in threads:
+        thread.join(timeout=1)
+    duration = time.time() - start_time
+    # 本次运行期间回收的子进程 CPU 时间（并行运行时包含其他子进程，是该进程 CPU 时间的上界）
+    cpu_used = _children_cpu_time() - start_cpu
+
+    stdout = stdout_capture.text()
+    stderr = stderr_capture.text()
+    returncode = process.returncode
+    exit_code = returncode if returncode >= 0 else None
+    signal_number = -returncode if returncode < 0 else None
+
+    if timed_out:
+        status = "timeout"
+    elif output_exceeded.is_set():
+        status = "output_limit"
+    elif signal_number in _CPU_LIMIT_SIGNALS:
+        status = "cpu_timeout"
+    elif returncode != 0 and any(marker in stderr for marker in _OOM_MARKERS):
+        status = "oom"
+    elif signal_number == signal.SIGKILL and limits.cpu_time is not None and cpu_used >= limits.cpu_time:
+        # 忽略 SIGXCPU 的程序到达 CPU 硬限制时被内核 SIGKILL
+        status = "cpu_timeout"
+    elif signal_number == signal.SIGKILL:
+        # 不是本函数发出的 SIGKILL，通常来自内核 OOM killer
+        status = "oom"
+    elif signal_number is not None:
+        status = "signal"
+    elif returncode != 0:
+        status = "exit"
+    else:
+        status = "ok"
+
+    return ExecutionResult(
+        status=status,
+        exit_code=exit_code,
+        signal=signal_number,
+        stdout=stdout,
+        stderr=stderr,
+        stdout_truncated=stdout_capture.truncated,
+        stderr_truncated=stderr_capture.truncated,
+        duration=duration
+    )
+
+
+def _limit_command(cmd: List[str], limits: ExecutionLimits) -> List[str]:
+    """
+    用 prlimit 包装命令：prlimit 设置 rlimit 后直接 exec 目标程序（进程号和进程组不变）
+    系统没有 prlimit 时只保留墙钟超时和输出上限
+    """
+    global _warned_no_prlimit
+    if _PRLIMIT is None:
+        if not _warned_no_prlimit:
+            print("警告：未找到 prlimit，子进程将不设置 CPU/内存等资源限制")
+            _warned_no_prlimit = True
+        return cmd
+    options = ["--core=0:0"]
+    if limits.cpu_time is not None:
+        # 软限制到达时发送 SIGXCPU，硬限制多留 1 秒后 SIGKILL
+        options.append(f"--cpu={limits.cpu_time}:{limits.cpu_time + 1}")
+    if limits.memory_bytes is not None:
+        options.append(f"--as={limits.memory_bytes}:{limits.memory_bytes}")
+    if limits.max_processes is not None:
+        options.append(f"--nproc={limits.max_processes}:{limits.max_processes}")
+    if limits.max_file_bytes is not None:
+        options.append(f"--fsize={limits.max_file_bytes}:{limits.max_file_bytes}")
+    return [_PRLIMIT, *options, "--", *cmd]
+
+
+def _children_cpu_time() -> float:
+    """已回收子进程的累计 CPU 时间（用户态 + 内核态，秒）"""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _kill_process_group(pid: int):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _feed_stdin(stream, data: bytes):
+    """写入 stdin，子进程提前退出导致的管道错误直接忽略"""
+    try:
+        stream.write(data)
+    except (BrokenPipeError, OSError):
+        pass
+    finally:
+        try:
+            stream.close()
+        except OSError:
+            pass
+
+
+class _StreamCapture:
+    """分块读取子进程输出，只保留前 limit 个字节"""
+
+    def __init__(self, stream, limit: int, exceeded: threading.Event):
+        self.stream = stream
+        self.limit = limit
+        self.exceeded = exceeded
+        self.chunks: List[bytes] = []
+        self.size = 0
+        self.truncated = False
+
+    def run(self):
+        try:
+            while True:
+                chunk = self.stream.read1(65536) if hasattr(self.stream, 'read1') else self.stream.read(65536)
+                if not chunk:
+                    break
+                remaining = self.limit - self.size
+                if remaining > 0:
+                    self.chunks.append(chunk[:remaining])
+                    self.size += min(len(chunk), remaining)
+                if len(chunk) > remaining:
+                    self.truncated = True
+                    self.exceeded.set()
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.stream.close()
+
+    def text(self) -> str:
+        data = b"".join(self.chunks).decode(errors='replace')
+        if self.truncated:
+            data += f"\n...（输出超过 {self.limit} 字节，已截断）"
+        return data
@@ -0,0 +1,170 @@
+from typing import Callable, Dict, Iterator, Optional, Tuple, Type, Union
+import json
+import re
+
+# 字段名 -> 期望的类型（或类型元组，允许为空时包含 type(None)）
+Schema = Dict[str, Union[Type, Tuple[Type, ...]]]
+Validator = Callable[[dict], None]
+
+_FENCE_PATTERN = re.compile(r"```[ \t]*(?:json|JSON)?[ \t]*\n(.*?)```", re.DOTALL)
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+_VALID_ESCAPES = set('"\\/bfnrtu')
+_TYPE_NAMES = {str: "字符串", list: "数组", dict: "对象", int: "整数", float: "数字", bool: "布尔值", type(None): "null"}
+# 逐个尝试的 "{" 起始位置上限，避免在很长的非 JSON 文本上反复解析
+_MAX_START_POSITIONS = 20
+
+# strict=False 允许字符串中出现未转义的换行等控制字符（模型输出代码时最常见的问题）
+_DECODER = json.JSONDecoder(strict=False)
+
+
+class StructuredOutputError(ValueError):
+    """模型回复中没有可用的 JSON，或 JSON 不符合约定的格式"""
+
+
+def repair_json(text: str) -> str:
+    """
+    修复模型输出 JSON 中的常见问题：
+    字符串中未转义的控制字符、非法的反斜杠转义（如正则中的 \\d）、// 注释、对象或数组末尾多余的逗号
+    """
+    out = []
+    in_string = False
+    i, n = 0, len(text)
+    while i < n:
+        ch = text[i]
+        if in_string:
+            if ch == "\\":
+                nxt = text[i + 1] if i + 1 < n else ""
+                if nxt in _VALID_ESCAPES:
+                    out.append(text[i:i + 2])
+                    i += 2
+                    continue
+                out.append("\\\\")
+            elif ch == '"':
+                in_string = False
+                out.append(ch)
+            elif ch in _CONTROL_ESCAPES:
+                out.append(_CONTROL_ESCAPES[ch])
+            elif ord(ch) < 0x20:
+                out.append(f"\\u{ord(ch):04x}")
+            else:
+                out.append(ch)
+        elif ch == '"':
+            in_string = True
+            out.append(ch)
+        elif text.startswith("//", i):
+            newline = text.find("\n", i)
+            i = n if newline < 0 else newline
+            continue
+        elif ch == ",":
+            j = i + 1
+            while j < n and text[j] in " \t\r\n":
+                j += 1
+            if j >= n or text[j] not in "}]":
+                out.append(ch)
+        else:
+            out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def _iter_json_objects(text: str) -> Iterator[dict]:
+    """
+    按优先级依次给出回复中可解析的 JSON 对象：
+    先是 ```json 代码块的内容，再从全文中每个 "{" 处尝试（跳过前面的说明文字，忽略后面的多余内容）
+    """
+    for match in _FENCE_PATTERN.finditer(text):
+        block = match.group(1)
+        # JSON 字符串中的代码本身可能带有 ```，代码块被截断时解析失败，会回退到全文
+        value = _decode_at(block, block.find("{"))
+        if value is not None:
+            yield value
+    start = text.find("{")
+    tried = 0
+    while start >= 0 and tried < _MAX_START_POSITIONS:
+        tried += 1
+        value = _decode_at(text, start)
+        if value is not None:
+            yield value
+        start = text.find("{", start + 1)
+
+
+def _decode_at(text: str, start: int) -> Optional[dict]:
+    """从 start 处解析一个 JSON 对象，原样解析失败时修复后再试"""
+    if start < 0:
+        return None
+    remainder = text[start:]
+    value = _try_decode(remainder)
+    if value is None:
+        value = _try_decode(repair_json(remainder))
+    return value
+
+
+def _try_decode(text: str) -> Optional[dict]:
+    """
+    解析开头的 JSON 对象，其后的内容（如代码块结束标记、说明文字）被忽略
+    空对象视为解析失败：它通常来自代码中的 {}（如 println!("{}")），而不是模型的回复
+    """
+    try:
+        value, _ = _DECODER.raw_decode(text)
+    except ValueError:
+        return None
+    return value if isinstance(value, dict) and value else None
+
+
+def extract_json(text: str) -> dict:
+    """
+    从模型回复中提取 JSON 对象：支持 ```json 代码块、前后的说明文字，并尝试修复常见格式问题
+    :raises StructuredOutputError: 没有找到可解析的 JSON 对象
+    """
+    for value in _iter_json_objects(text or ""):
+        return value
+    raise StructuredOutputError("无效的JSON格式：回复中没有可解析的JSON对象")
+
+
+def validate_schema(data: dict, schema: Optional[Schema] = None, validator: Optional[Validator] = None) -> dict:
+    """
+    校验必需字段及其类型，再执行自定义校验
+    :param schema: 必需字段 -> 期望类型
+    :param validator: 额外的校验函数，不合法时抛出 ValueError
+    :raises StructuredOutputError: 缺少字段、类型不符或自定义校验失败
+    """
+    for name, expected in (schema or {}).items():
+        if name not in data:
+            raise StructuredOutputError(f"响应缺少必要字段：{name}")
+        if not isinstance(data[name], expected):
+            raise StructuredOutputError(f"字段 {name} 应为{_type_name(expected)}")
+    if validator is not None:
+        try:
+            validator(data)
+        except StructuredOutputError:
+            raise
+        except ValueError as e:
+            raise StructuredOutputError(str(e))
+    return data
+
+
+def parse_json_response(text: str, schema: Optional[Schema] = None, validator: Optional[Validator] = None) -> dict:
+    """
+    提取并校验模型回复中的 JSON 对象，返回第一个通过校验的对象
+    （回复中的代码可能包含 {} 等片段，不符合格式的对象会被跳过）
+    :raises StructuredOutputError: 没有可解析的 JSON，或所有对象都不符合格式（报告第一个对象的错误）
+    """
+    first_error = None
+    for value in _iter_json_objects(text or ""):
+        try:
+            return validate_schema(value, schema, validator)
+        except StructuredOutputError as e:
+            first_error = first_error or e
+    raise first_error or StructuredOutputError("无效的JSON格式：回复中没有可解析的JSON对象")
+
+
+def describe_schema(schema: Optional[Schema]) -> str:
+    """生成字段说明，用于修复请求的提示"""
+    if not schema:
+        return ""
+    return "、".join(f'"{name}"（{_type_name(expected)}）' for name, expected in schema.items())
+
+
+def _type_name(expected: Union[Type, Tuple[Type, ...]]) -> str:
+    types = expected if isinstance(expected, tuple) else (expected,)
+    return "或".join(_TYPE_NAMES.get(t, t.__name__) for t in types)
@@ -0,0 +1,39 @@
+from typing import Callable
+import re
+
+try:
+    import tiktoken
+except ImportError:  # 只有使用 make_tiktoken_counter 时才需要 tiktoken
+    tiktoken = None
+
+# 中日韩字符大致一个字一个 token，其余文本按约 4 个字符一个 token 估算
+_CJK_RANGES = r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef'
+_CJK_PATTERN = re.compile(f'[{_CJK_RANGES}]')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估计文本的 token 数（不依赖具体模型的分词器）
+    :param text: 待估计的文本
+    :return: 估计的 token 数
+    """
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + (other_count + 3) // 4
+
+
+def make_tiktoken_counter(encoding_name: str = "cl100k_base") -> Callable[[str], int]:
+    """
+    基于 tiktoken 分词器的精确计数器，可作为 AIAgent 的 token_counter
+    :param encoding_name: tiktoken 编码名称（如 cl100k_base、o200k_base）
+    """
+    if tiktoken is None:
+        raise RuntimeError("make_tiktoken_counter 需要 tiktoken，请先执行 pip install tiktoken")
+    encoding = tiktoken.get_encoding(encoding_name)
+
+    def count(text: str) -> int:
+        return len(encoding.encode(text, disallowed_special=())) if text else 0
+
+    return count
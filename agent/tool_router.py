@@ -0,0 +1,110 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Pattern, Tuple, Union
+import re
+import threading
+
+# 规则：工具名 -> [(正则, 权重), ...]
+RoutingRules = Dict[str, List[Tuple[Union[str, Pattern], float]]]
+
+_PUNCTUATION = re.compile(r"[\s，。！？、；：,.!?;:]+")
+
+
+@dataclass
+class RouteDecision:
+    """
+    一次路由结果
+    :param tool: 选中的工具名
+    :param action: 交给工具执行的具体操作
+    :param reason: 选择理由
+    :param confidence: 置信度（0~1）
+    :param source: 决策来源：rules（本地规则）/ llm（模型选择）/ cache（缓存命中）
+    """
+    tool: str
+    action: str
+    reason: str = ""
+    confidence: float = 1.0
+    source: str = "rules"
+
+
+class ToolRouter:
+    def __init__(self, rules: RoutingRules, threshold: float = 0.75, min_score: float = 1.0,
+                 cache_size: int = 256):
+        """
+        基于关键词/正则的本地路由器，置信度足够时直接选择工具，不必让模型选择
+        :param rules: 每个工具的匹配规则及权重（字符串规则按 ASCII 语义编译，\\b 只看英文单词边界，中英文混写时也能匹配）
+        :param threshold: 置信度阈值，最高分占全部得分的比例低于该值时交给模型选择
+        :param min_score: 最高分低于该值时视为没有命中任何规则
+        :param cache_size: 按规范化请求缓存工具选择的条目数（LRU 淘汰）
+        """
+        self.rules = {
+            tool: [(re.compile(pattern, re.IGNORECASE | re.ASCII) if isinstance(pattern, str) else pattern, weight)
+                   for pattern, weight in patterns]
+            for tool, patterns in rules.items()
+        }
+        self.threshold = threshold
+        self.min_score = min_score
+        self.cache_size = cache_size
+        # 规范化请求 -> (工具, 理由, 置信度)；action 与具体请求相关，不缓存
+        self._cache: "OrderedDict[str, Tuple[str, str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """规范化请求：小写、合并空白和标点，用作缓存键"""
+        return _PUNCTUATION.sub(" ", text.lower()).strip()
+
+    def score(self, text: str) -> Dict[str, float]:
+        """计算每个工具的规则得分（同一条规则只计一次）"""
+        return {
+            tool: sum(weight for pattern, weight in patterns if pattern.search(text))
+            for tool, patterns in self.rules.items()
+        }
+
+    def route(self, text: str) -> Optional[RouteDecision]:
+        """
+        路由请求
+        :return: 缓存命中或规则置信度足够时返回 RouteDecision，否则返回 None（交给模型选择）；
+                 缓存命中时只复用工具选择，action 为本次请求的原文
+        """
+        key = self.normalize(text)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                tool, reason, confidence = cached
+                return RouteDecision(tool, text, reason, confidence, "cache")
+
+        scores = self.score(text)
+        total = sum(scores.values())
+        tool, best = max(scores.items(), key=lambda item: item[1], default=(None, 0.0))
+        if tool is None or best < self.min_score:
+            return None
+        confidence = best / total
+        if confidence < self.threshold:
+            return None
+
+        decision = RouteDecision(
+            tool=tool,
+            action=text,
+            reason=f"规则匹配（得分 {best:g}，置信度 {confidence:.2f}）",
+            confidence=confidence
+        )
+        self.remember(text, decision)
+        return decision
+
+    def remember(self, text: str, decision: RouteDecision):
+        """
+        缓存工具选择（包括模型做出的选择），规范化后相同的请求再次出现时直接复用
+        只缓存工具、理由和置信度：规范化会丢掉大小写和标点，action 需按每次请求的原文生成
+        """
+        key = self.normalize(text)
+        with self._lock:
+            self._cache[key] = (decision.tool, decision.reason, decision.confidence)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
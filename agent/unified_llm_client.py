@@ -1,13 +1,28 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple, Union, Iterator
 import time
 import logging
 import os
+import threading
 from datetime import datetime
+from response_cache import ResponseCache
 
 class UnifiedLLMClient:
-    def __init__(self):
+    def __init__(
+        self,
+        pool_size: int = 10,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 300.0,
+        cache: Optional[ResponseCache] = None
+    ):
+        """
+        :param pool_size: 每个 base_url 的连接池大小（最大保持的长连接数）
+        :param connect_timeout: 建立连接的超时时间（秒）
+        :param read_timeout: 等待响应的超时时间（秒），模型配置中的 "timeout" 可覆盖
+        :param cache: 可选的响应缓存，相同模型、prompt 和采样参数的请求直接返回缓存结果
+        """
         self.configs = {
             # 预定义的模型配置模板
             "deepseek": {
@@ -18,7 +33,10 @@ class UnifiedLLMClient:
                 },
                 "endpoint": "/chat/completions",
                 "prompt_field": "messages",
-                "response_field": "choices[0].message.content"
+                "response_field": "choices[0].message.content",
+                "stream_format": "sse",  # 流式输出为 Server-Sent Events
+                "stream_field": "choices[0].delta.content",
+                "history_token_budget": 32000  # AIAgent 对话历史的 token 上限
             },
             "openai": {
                 "base_url": "https://api.openai.com/v1",
@@ -28,10 +46,30 @@ class UnifiedLLMClient:
                 },
                 "endpoint": "/chat/completions",
                 "prompt_field": "messages",
-                "response_field": "choices[0].message.content"
+                "response_field": "choices[0].message.content",
+                "stream_format": "sse",
+                "stream_field": "choices[0].delta.content",
+                "history_token_budget": 32000
             },
-            # 在 UnifiedLLMClient 的 __init__ 方法中，修改 Ollama 的配置：
+            # Ollama 使用 /api/chat：按消息列表发送，服务端按模型模板拼接，
+            # max_tokens / temperature 映射到 options，keep_alive 让模型在两次调用之间常驻内存
             "ollama": {
+                "base_url": "http://localhost:11434",
+                "headers": {
+                    "Content-Type": "application/json"
+                },
+                "endpoint": "/api/chat",
+                "prompt_field": "messages",
+                "response_field": "message.content",
+                "stream_format": "ndjson",  # 流式输出为每行一个 JSON
+                "stream_field": "message.content",
+                "history_token_budget": 6000,  # 本地模型上下文较小
+                "api_style": "ollama",
+                "keep_alive": "30m",
+                "params": {"stream": False}  # 添加默认参数
+            },
+            # 旧的 /api/generate 接口（整段文本 prompt）
+            "ollama_generate": {
                 "base_url": "http://localhost:11434",
                 "headers": {
                     "Content-Type": "application/json"
@@ -39,11 +77,23 @@ class UnifiedLLMClient:
                 "endpoint": "/api/generate",
                 "prompt_field": "prompt",
                 "response_field": "response",
-                "params": {"stream": False}  # 添加默认参数
+                "stream_format": "ndjson",
+                "stream_field": "response",
+                "history_token_budget": 6000,
+                "api_style": "ollama",
+                "keep_alive": "30m",
+                "params": {"stream": False}
             }
         }
         self.active_models = {}  # 存储已配置的模型信息
 
+        # 每个 base_url 复用一个带连接池的 Session，避免每次请求重新握手
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self._sessions: Dict[str, requests.Session] = {}
+        self._session_lock = threading.Lock()
+        self.cache = cache
+
         # 设置日志
         self._setup_logging()
 
@@ -75,6 +125,34 @@ class UnifiedLLMClient:
         self.file_logger.setLevel(logging.INFO)
         self.file_logger.addHandler(file_handler)
 
+    def _get_session(self, base_url: str) -> requests.Session:
+        """获取 base_url 对应的长连接 Session（不存在时创建）"""
+        with self._session_lock:
+            session = self._sessions.get(base_url)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[base_url] = session
+            return session
+
+    def _get_timeout(self, config: Dict) -> Tuple[float, float]:
+        """模型配置中的 timeout 可以是读超时秒数或 (连接超时, 读超时)"""
+        timeout = config.get("timeout")
+        if timeout is None:
+            return self.timeout
+        if isinstance(timeout, (int, float)):
+            return (self.timeout[0], float(timeout))
+        return tuple(timeout)
+
+    def close(self):
+        """关闭所有连接池"""
+        with self._session_lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
     def _format_json(self, data: Dict) -> str:
         """格式化 JSON 数据，保持换行符的原始形式"""
         class NonEscapingJSONEncoder(json.JSONEncoder):
@@ -124,9 +202,15 @@ class UnifiedLLMClient:
         prompt: str,
         max_tokens: int = 100,
         temperature: float = 0.7,
+        timeout: Optional[Union[float, Tuple[float, float]]] = None,
+        use_cache: bool = True,
         **kwargs
     ) -> str:
-        """统一生成接口"""
+        """
+        统一生成接口
+        :param timeout: 本次请求的超时，读超时秒数或 (连接超时, 读超时)，默认使用模型/客户端配置
+        :param use_cache: 配置了响应缓存时是否使用缓存
+        """
         start_time = time.time()
         
         # 详细日志写入文件
@@ -136,35 +220,28 @@ class UnifiedLLMClient:
         # 简洁信息显示给用户
         self.logger.info("\n正在生成回复...")
 
-        if model_name not in self.active_models:
-            raise ValueError(f"模型 {model_name} 未配置，请先调用 add_model()")
-
-        model_config = self.active_models[model_name]
-        config = model_config["config"]
-        endpoint = f"{config['base_url']}{config['endpoint']}"
+        config, endpoint, data = self._build_request(
+            model_name, prompt, max_tokens, temperature, **kwargs
+        )
 
-        # 构造请求数据
-        data = {
-            config['prompt_field']: prompt,
-            "max_tokens": max_tokens,
-            "temperature": temperature,
-            "model": model_config.get("model"),
-            **config.get("params", {}),
-            **kwargs
-        }
-        
-        # 详细请求信息写入文件日志
-        self.file_logger.info(f"\n请求 URL: {endpoint}")
-        self.file_logger.info("请求头:")
-        self.file_logger.info(self._format_json(config['headers']))
-        self.file_logger.info("请求数据:")
-        self.file_logger.info(self._format_json(data))
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = self._make_cache_key(endpoint, data, config['prompt_field'])
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self.file_logger.info("命中响应缓存")
+                self.file_logger.info(cached)
+                self.logger.info("完成！(命中缓存)\n")
+                return cached
 
         try:
-            response = requests.post(
+            if timeout is None:
+                timeout = self._get_timeout(config)
+            response = self._get_session(config["base_url"]).post(
                 endpoint,
                 headers=config["headers"],
-                json=data
+                json=data,
+                timeout=timeout
             )
             response.raise_for_status()
             
@@ -185,7 +262,9 @@ class UnifiedLLMClient:
             
             # 简洁信息显示给用户
             self.logger.info(f"完成！(耗时 {elapsed_time:.1f}秒)\n")
-            
+
+            if cache_key is not None and result:
+                self.cache.put(cache_key, result)
             return result
         except requests.exceptions.RequestException as e:
             elapsed_time = time.time() - start_time
@@ -201,6 +280,190 @@ class UnifiedLLMClient:
             self.logger.error(f"生成失败：{str(e)}")
             raise RuntimeError(f"请求失败: {str(e)}")
 
+    def generate_stream(
+        self,
+        model_name: str,
+        prompt: str,
+        max_tokens: int = 100,
+        temperature: float = 0.7,
+        timeout: Optional[Union[float, Tuple[float, float]]] = None,
+        **kwargs
+    ) -> Iterator[str]:
+        """
+        流式生成接口，逐段返回生成的文本
+        支持 Ollama 的 NDJSON 和 OpenAI/DeepSeek 的 SSE 两种流式格式
+        参数同 generate()
+        """
+        start_time = time.time()
+        self.file_logger.info(f"\n{'='*50}\n开始流式生成回复...")
+        self.file_logger.info(f"使用模型: {model_name}")
+
+        config, endpoint, data = self._build_request(
+            model_name, prompt, max_tokens, temperature, stream=True, **kwargs
+        )
+        stream_format = config.get("stream_format", "ndjson")
+        stream_field = config.get("stream_field", config["response_field"])
+
+        chunks = []
+        first_token_time = None
+        try:
+            if timeout is None:
+                timeout = self._get_timeout(config)
+            response = self._get_session(config["base_url"]).post(
+                endpoint,
+                headers=config["headers"],
+                json=data,
+                timeout=timeout,
+                stream=True
+            )
+            response.raise_for_status()
+            with response:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    line = line.decode('utf-8')
+                    if stream_format == "sse":
+                        # SSE：只处理 data 行，[DONE] 表示结束
+                        if not line.startswith("data:"):
+                            continue
+                        line = line[len("data:"):].strip()
+                        if line == "[DONE]":
+                            break
+                    event = json.loads(line)
+                    text = self._extract_stream_chunk(event, stream_field)
+                    if text:
+                        if first_token_time is None:
+                            first_token_time = time.time() - start_time
+                        chunks.append(text)
+                        yield text
+                    if stream_format == "ndjson" and event.get("done"):
+                        break
+        except requests.exceptions.RequestException as e:
+            elapsed_time = time.time() - start_time
+            self.file_logger.error(f"流式请求失败，耗时：{elapsed_time:.2f}秒")
+            self.file_logger.error(f"错误信息: {str(e)}")
+            self.logger.error(f"生成失败：{str(e)}")
+            raise RuntimeError(f"请求失败: {str(e)}")
+        finally:
+            elapsed_time = time.time() - start_time
+            self.file_logger.info(
+                f"流式生成结束，首个 token 耗时：{first_token_time or 0:.2f}秒，总耗时：{elapsed_time:.2f}秒"
+            )
+            self.file_logger.info("生成结果:")
+            self.file_logger.info("".join(chunks))
+            self.file_logger.info('='*50)
+
+    def warmup(self, model_name: str, keep_alive: Optional[str] = None) -> bool:
+        """
+        预加载模型：Ollama 收到不含 prompt 的请求时只把模型加载进内存，并按 keep_alive 保持常驻
+        其他服务无需预热，直接返回 False
+        :param keep_alive: 常驻时长（如 "30m"，-1 表示一直保持），默认使用模型配置中的 keep_alive
+        :return: 是否完成预热
+        """
+        if model_name not in self.active_models:
+            raise ValueError(f"模型 {model_name} 未配置，请先调用 add_model()")
+        model_config = self.active_models[model_name]
+        config = model_config["config"]
+        if config.get("api_style") != "ollama":
+            return False
+
+        data = {
+            "model": model_config.get("model"),
+            "keep_alive": keep_alive or config.get("keep_alive", "30m")
+        }
+        if config["prompt_field"] == "messages":
+            data["messages"] = []
+        start_time = time.time()
+        try:
+            response = self._get_session(config["base_url"]).post(
+                f"{config['base_url']}{config['endpoint']}",
+                headers=config["headers"],
+                json=data,
+                timeout=self._get_timeout(config)
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            self.logger.warning(f"模型预热失败：{str(e)}")
+            return False
+        self.file_logger.info(f"模型 {model_name} 预热完成，耗时：{time.time() - start_time:.2f}秒")
+        return True
+
+    def _make_cache_key(self, endpoint: str, data: Dict, prompt_field: str) -> str:
+        """按实际请求的模型、prompt 和全部采样参数生成缓存键"""
+        extra = {
+            k: v for k, v in data.items()
+            if k not in (prompt_field, "model", "temperature", "max_tokens", "keep_alive")
+        }
+        extra["endpoint"] = endpoint
+        return ResponseCache.make_key(
+            data.get("model"),
+            data[prompt_field],
+            data.get("temperature"),
+            data.get("max_tokens"),
+            extra
+        )
+
+    def _build_request(
+        self,
+        model_name: str,
+        prompt,
+        max_tokens: int,
+        temperature: float,
+        **kwargs
+    ) -> Tuple[Dict, str, Dict]:
+        """
+        构造请求的 (模型配置, 请求 URL, 请求数据)，并把请求详情写入文件日志
+        """
+        if model_name not in self.active_models:
+            raise ValueError(f"模型 {model_name} 未配置，请先调用 add_model()")
+
+        model_config = self.active_models[model_name]
+        config = model_config["config"]
+        endpoint = f"{config['base_url']}{config['endpoint']}"
+
+        # 构造请求数据
+        if config.get("api_style") == "ollama":
+            # Ollama 不识别顶层的 max_tokens / temperature，采样参数放在 options 中
+            options = {
+                "num_predict": max_tokens,
+                "temperature": temperature,
+                **config.get("options", {}),
+                **kwargs.pop("options", {})
+            }
+            data = {
+                config['prompt_field']: prompt,
+                "model": model_config.get("model"),
+                "options": options,
+                **config.get("params", {}),
+                **kwargs
+            }
+            if config.get("keep_alive") is not None:
+                data.setdefault("keep_alive", config["keep_alive"])
+        else:
+            data = {
+                config['prompt_field']: prompt,
+                "max_tokens": max_tokens,
+                "temperature": temperature,
+                "model": model_config.get("model"),
+                **config.get("params", {}),
+                **kwargs
+            }
+        
+        # 详细请求信息写入文件日志
+        self.file_logger.info(f"\n请求 URL: {endpoint}")
+        self.file_logger.info("请求头:")
+        self.file_logger.info(self._format_json(config['headers']))
+        self.file_logger.info("请求数据:")
+        self.file_logger.info(self._format_json(data))
+        return config, endpoint, data
+
+    def _extract_stream_chunk(self, event: Dict, field_path: str) -> str:
+        """从流式事件中提取文本，缺少字段（如只含 usage 的事件）时返回空字符串"""
+        try:
+            return self._extract_response(event, field_path) or ""
+        except (IndexError, KeyError, TypeError, ValueError):
+            return ""
+
     def _extract_response(self, response: Dict, field_path: str) -> str:
         """
         从嵌套的响应中提取目标字段
@@ -0,0 +1,123 @@
+from typing import Optional
+import os
+import shutil
+import tempfile
+
+from build_cache import copy_executable
+
+# 优先使用的内存文件系统
+_TMPFS_CANDIDATES = ("/dev/shm",)
+
+
+def default_workspace_root(prefer_tmpfs: bool = True) -> str:
+    """
+    选择工作目录的根目录：优先使用可写且允许执行的 tmpfs，否则使用系统临时目录
+    """
+    if prefer_tmpfs:
+        for path in _TMPFS_CANDIDATES:
+            if _usable_for_executables(path):
+                return path
+    return tempfile.gettempdir()
+
+
+def _usable_for_executables(path: str) -> bool:
+    """目录存在、可写，且所在文件系统没有以 noexec 挂载"""
+    if not os.path.isdir(path) or not os.access(path, os.W_OK | os.X_OK):
+        return False
+    try:
+        return not (os.statvfs(path).f_flag & getattr(os, "ST_NOEXEC", 0))
+    except OSError:
+        return False
+
+
+class Workspace:
+    def __init__(self, root: str, source_name: str):
+        """
+        一次尝试使用的独立工作目录，包含源文件、可执行文件和其他输出
+        :param root: 工作目录（由 WorkspaceManager 创建）
+        :param source_name: 源文件名（如 main.rs）
+        """
+        self.root = root
+        self.source_path = os.path.join(root, source_name)
+        self.executable_path = os.path.join(root, os.path.splitext(source_name)[0])
+
+    def write_source(self, code: str):
+        with open(self.source_path, 'w', encoding='utf-8') as f:
+            f.write(code)
+
+    def read_source(self) -> str:
+        with open(self.source_path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def output_path(self, name: str) -> str:
+        """工作目录中其他输出文件的路径"""
+        return os.path.join(self.root, name)
+
+    def promote(self, source_path: str, executable_path: Optional[str] = None):
+        """
+        把源文件（以及已编译的可执行文件）原子地发布到目标位置：
+        先复制到目标目录下的临时文件再 os.replace，其他进程不会读到写了一半的文件
+        """
+        target_dir = os.path.dirname(os.path.abspath(source_path))
+        fd, tmp_path = tempfile.mkstemp(dir=target_dir, prefix=".tmp-")
+        os.close(fd)
+        try:
+            shutil.copyfile(self.source_path, tmp_path)
+            # mkstemp 创建的文件权限为 0600：沿用原文件的权限，新文件按 umask 使用默认权限
+            if os.path.exists(source_path):
+                shutil.copymode(source_path, tmp_path)
+            else:
+                os.chmod(tmp_path, 0o666 & ~_current_umask())
+            os.replace(tmp_path, source_path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if executable_path and os.path.exists(self.executable_path):
+            copy_executable(self.executable_path, executable_path)
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self) -> "Workspace":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+
+
+def _current_umask() -> int:
+    """读取进程的 umask（优先读 /proc，避免临时修改 umask 影响其他线程）"""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError, IndexError):
+        pass
+    mask = os.umask(0o022)
+    os.umask(mask)
+    return mask
+
+
+class WorkspaceManager:
+    def __init__(self, base_dir: Optional[str] = None, prefer_tmpfs: bool = True):
+        """
+        为每次尝试分配独立的临时工作目录，多个会话或并行候选互不覆盖
+        :param base_dir: 工作目录的根目录，默认优先使用 /dev/shm（tmpfs），否则为系统临时目录
+        :param prefer_tmpfs: 未指定 base_dir 时是否优先使用 tmpfs
+        """
+        self.base_dir = os.path.join(base_dir or default_workspace_root(prefer_tmpfs), "simpleagent-workspaces")
+        os.makedirs(self.base_dir, exist_ok=True)
+
+    def create(self, source_name: str, code: Optional[str] = None, prefix: str = "attempt-") -> Workspace:
+        """
+        创建工作目录
+        :param source_name: 源文件名
+        :param code: 可选的初始源码
+        :param prefix: 目录名前缀，便于排查
+        """
+        workspace = Workspace(tempfile.mkdtemp(dir=self.base_dir, prefix=prefix), source_name)
+        if code is not None:
+            workspace.write_source(code)
+        return workspace
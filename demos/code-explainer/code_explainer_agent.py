@@ -2,7 +2,7 @@ import sys
 sys.path.append("../../agent")
 from unified_llm_client import UnifiedLLMClient
 from ai_agent import AIAgent
-from typing import Optional
+from typing import Optional, Iterator
 
 class CodeExplainerAgent(AIAgent):
     def __init__(
@@ -71,27 +71,37 @@ class CodeExplainerAgent(AIAgent):
         except Exception as e:
             raise RuntimeError(f"读取文件失败：{str(e)}")
 
-    def explain(self, question: str) -> str:
+    def _build_prompt(self, question: str) -> Optional[str]:
         """
-        解释代码相关问题
-        :param question: 用户问题
-        :return: 解释内容
+        构造解释提示，没有可用代码时返回 None
+        代码作为静态上下文固定在系统提示之后（代码变化时原位更新），提示本身只包含问题
         """
         # 在解释前重新尝试加载代码
         self._try_load_code()
         
         if not self.cpp_code and not self.rust_code:
-            return "错误：没有可用的代码文件进行解释。请先使用converter生成Rust代码。"
+            return None
             
-        prompt = "请解释以下代码相关的问题：\n\n"
+        context = "需要解释的代码：\n\n"
         
         if self.cpp_code:
-            prompt += f"C++代码：\n```cpp\n{self.cpp_code}\n```\n\n"
+            context += f"C++代码：\n```cpp\n{self.cpp_code}\n```\n\n"
             
         if self.rust_code:
-            prompt += f"Rust代码：\n```rust\n{self.rust_code}\n```\n\n"
+            context += f"Rust代码：\n```rust\n{self.rust_code}\n```\n\n"
             
-        prompt += f"问题：{question}"
+        self.set_static_context(context)
+        return f"请解释上文代码相关的问题：{question}"
+
+    def explain(self, question: str) -> str:
+        """
+        解释代码相关问题
+        :param question: 用户问题
+        :return: 解释内容
+        """
+        prompt = self._build_prompt(question)
+        if prompt is None:
+            return "错误：没有可用的代码文件进行解释。请先使用converter生成Rust代码。"
         
         return self.chat(
             prompt,
@@ -99,6 +109,22 @@ class CodeExplainerAgent(AIAgent):
             temperature=0.3
         )
 
+    def explain_stream(self, question: str) -> Iterator[str]:
+        """
+        流式解释代码相关问题，逐段返回解释内容
+        :param question: 用户问题
+        """
+        prompt = self._build_prompt(question)
+        if prompt is None:
+            yield "错误：没有可用的代码文件进行解释。请先使用converter生成Rust代码。"
+            return
+        
+        yield from self.chat_stream(
+            prompt,
+            max_tokens=1000,
+            temperature=0.3
+        )
+
     def interactive_explanation(self):
         """交互式解释流程"""
         print("代码解释器已启动！")
@@ -111,8 +137,9 @@ class CodeExplainerAgent(AIAgent):
                 break
                 
             try:
-                explanation = self.explain(question)
                 print("\n解释：")
-                print(explanation)
+                for chunk in self.explain_stream(question):
+                    print(chunk, end="", flush=True)
+                print()
             except Exception as e:
                 print(f"解释失败：{str(e)}")
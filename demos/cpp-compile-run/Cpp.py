@@ -1,8 +1,35 @@
 import subprocess
+import os
+import sys
+sys.path.append("../../agent")
+from build_cache import BuildCache
+from diagnostics import summarize_compiler_output
+from sandbox import ExecutionLimits, ExecutionResult, run_sandboxed
 
 class Cpp:
-    def __init__(self, file_path):
+    def __init__(self, file_path, build_cache: BuildCache = None, limits: ExecutionLimits = None,
+                 check_first: bool = False, diagnostic_format: str = "human",
+                 diagnostic_token_budget: int = 1500, executable_path: str = None):
+        """
+        :param file_path: 源代码路径
+        :param build_cache: 可选的编译缓存，源码和编译参数未变时直接复用上次的编译结果
+        :param limits: 运行程序时的资源限制（超时、CPU、内存、进程数、输出大小），默认使用 ExecutionLimits()
+        :param check_first: 编译前是否先执行 -fsyntax-only 快速检查，语法/类型错误可以更快返回
+        :param diagnostic_format: "human" 原样返回编译器输出；"json" 使用 -fdiagnostics-format=json，
+                                  返回去重、排序并截断后的诊断（结构化结果保存在 last_diagnostics）
+        :param diagnostic_token_budget: json 模式下诊断文本的 token 上限
+        :param executable_path: 可执行文件路径，默认为源文件路径去掉 .cpp 后缀
+        """
+        if diagnostic_format not in ("human", "json"):
+            raise ValueError(f"不支持的诊断格式：{diagnostic_format}")
         self.file_path = file_path
+        self.executable_path = executable_path or file_path[:-4]  # 默认去掉 .cpp 后缀
+        self.build_cache = build_cache
+        self.limits = limits or ExecutionLimits()
+        self.check_first = check_first
+        self.diagnostic_format = diagnostic_format
+        self.diagnostic_token_budget = diagnostic_token_budget
+        self.last_diagnostics = []
 
     def cpp_compile(self):
         """
@@ -16,16 +43,82 @@ class Cpp:
             success_flag(int): 0 for success, 1 for failure
             result_message(str): 编译输出或错误信息
         """
+        compile_flag, compile_output = self._gcc_compile()
+        return compile_flag, self._summarize_diagnostics(compile_flag, compile_output)
+
+    def _gcc_compile(self):
+        """使用 g++ 编译，返回编译器的原始输出"""
         file_path = self.file_path
-        executable_path = file_path[:-4]  # 去掉 .cpp 后缀，得到可执行文件的路径
+        executable_path = self.executable_path
+        flags = self._diagnostic_flags()
+        cache_key = self._cache_key('g++', flags)
+        if cache_key is not None:
+            cached = self.build_cache.lookup(cache_key, executable_path)
+            if cached is not None:
+                return cached
+
+        compile_flag, compile_output = 0, ""
+        if self.check_first:
+            compile_flag, compile_output = self._gcc_check()
+        if compile_flag == 0:
+            try:
+                # 使用 subprocess 模块的 run 方法调用 g++ 编译命令
+                result = subprocess.run(['g++', file_path, *flags, '-o', executable_path], 
+                                     check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                compile_flag, compile_output = 0, result.stdout.decode()
+            except subprocess.CalledProcessError as e:
+                compile_flag, compile_output = 1, e.stderr.decode()
+
+        if cache_key is not None:
+            self.build_cache.store(cache_key, compile_flag, compile_output, executable_path)
+        return compile_flag, compile_output
+
+    def cpp_check(self):
+        """
+        快速检查：使用 -fsyntax-only 只做语法和语义检查，不生成代码也不链接
+
+        Returns:
+        pair:
+            success_flag(int): 0 for success, 1 for failure
+            result_message(str): 检查输出或错误信息
+        """
+        check_flag, check_output = self._gcc_check()
+        return check_flag, self._summarize_diagnostics(check_flag, check_output)
+
+    def _gcc_check(self):
+        """g++ -fsyntax-only 检查，返回编译器的原始输出"""
         try:
-            # 使用 subprocess 模块的 run 方法调用 g++ 编译命令
-            result = subprocess.run(['g++', file_path, '-o', executable_path], 
+            result = subprocess.run(['g++', '-fsyntax-only', *self._diagnostic_flags(), self.file_path],
                                  check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
             return 0, result.stdout.decode()
         except subprocess.CalledProcessError as e:
             return 1, e.stderr.decode()
 
+    def _diagnostic_flags(self):
+        return ['-fdiagnostics-format=json'] if self.diagnostic_format == "json" else []
+
+    def _summarize_diagnostics(self, compile_flag, compile_output):
+        """json 模式下把编译器输出解析为结构化诊断，返回精简后的文本"""
+        if self.diagnostic_format != "json":
+            return compile_output
+        self.last_diagnostics, text = summarize_compiler_output(
+            compile_output, 'g++', self.diagnostic_token_budget, source_path=self.file_path
+        )
+        if compile_flag == 0 and not self.last_diagnostics:
+            return ""
+        return text
+
+    def _cache_key(self, compiler, flags):
+        """
+        计算编译缓存键，未配置缓存或源文件不存在时返回 None
+        诊断信息中包含源文件路径，因此路径也计入缓存键
+        """
+        if self.build_cache is None or not os.path.exists(self.file_path):
+            return None
+        return self.build_cache.make_key(
+            [self.file_path], compiler, flags + [os.path.abspath(self.file_path)]
+        )
+
     def cpp_run(self, input_file=None):
         """
         Run executable file
@@ -38,27 +131,26 @@ class Cpp:
             success_flag(int): 0 for success, 1 for failure
             result_message(str): 运行时输出或错误信息
         """
-        executable_path = self.file_path[:-4]  # 去掉 .cpp 后缀，得到可执行文件的路径
         try:
-            if input_file:
-                # 如果提供了输入文件，从文件重定向输入
-                with open(input_file, 'r') as f:
-                    result = subprocess.run([executable_path], 
-                                         input=f.read().encode(),
-                                         check=True, 
-                                         stdout=subprocess.PIPE, 
-                                         stderr=subprocess.PIPE)
-            else:
-                # 原有的运行方式
-                result = subprocess.run([executable_path], 
-                                     check=True, 
-                                     stdout=subprocess.PIPE, 
-                                     stderr=subprocess.PIPE)
-            return 0, result.stdout.decode()
-        except subprocess.CalledProcessError as e:
-            return 1, e.stderr.decode()
-        except FileNotFoundError as e:
+            result = self.cpp_run_detailed(input_file)
+        except FileNotFoundError:
             return 1, f"Input file not found: {input_file}"
+        if result.ok:
+            return 0, result.stdout
+        return 1, result.error_message()
+
+    def cpp_run_detailed(self, input_file=None) -> ExecutionResult:
+        """
+        在资源受限的沙箱中运行可执行文件，返回结构化结果
+        （状态：ok / exit / timeout / cpu_timeout / oom / signal / output_limit / error）
+        """
+        executable_path = self.executable_path
+        input_data = None
+        if input_file:
+            # 如果提供了输入文件，从文件重定向输入
+            with open(input_file, 'rb') as f:
+                input_data = f.read()
+        return run_sandboxed([executable_path], input_data, self.limits)
 
 # 使用示例
 if __name__ == '__main__':
@@ -0,0 +1,272 @@
+import sys
+sys.path.append("../../agent")
+from unified_llm_client import UnifiedLLMClient
+from knowledge_base import KnowledgeBaseRegistry, default_registry
+from code_converter_agent import CodeConverterAgent
+from code_modifier_agent import CodeModifierAgent
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+@dataclass
+class BatchResult:
+    """单个文件的批量转换结果，对应报告中的一行"""
+    cpp_path: str
+    status: str              # success / failed / error
+    output_dir: str
+    rust_path: str
+    message: str
+    duration: float
+    finished_at: float
+
+
+class BatchConversionPipeline:
+    def __init__(
+        self,
+        client: UnifiedLLMClient,
+        model_name: str,
+        output_root: str,
+        knowledge_base_path: str = "",
+        embedding_model: str = "all-MiniLM-L6-v2",
+        max_workers: int = 4,
+        report_path: Optional[str] = None,
+        fix: bool = True,
+        registry: Optional[KnowledgeBaseRegistry] = None
+    ):
+        """
+        批量C++到Rust转换流水线：转换、编译和修正循环在有界线程池中并发执行
+        每个文件使用独立的Agent（独立对话历史）和独立的输出目录
+        :param client: 配置好的 UnifiedLLMClient 实例
+        :param model_name: 使用的模型名称
+        :param output_root: 输出根目录，每个文件输出到其下的独立子目录
+        :param knowledge_base_path: 知识库路径（所有文件共享同一份索引）
+        :param embedding_model: 嵌入模型
+        :param max_workers: 并发处理的文件数
+        :param report_path: JSONL 结果报告路径，默认为 output_root/report.jsonl
+        :param fix: 转换后是否执行编译和修正循环
+        :param registry: 共享知识库索引的注册表
+        """
+        self.client = client
+        self.model_name = model_name
+        self.output_root = output_root
+        self.knowledge_base_path = knowledge_base_path
+        self.embedding_model = embedding_model
+        self.max_workers = max_workers
+        self.report_path = report_path or os.path.join(output_root, "report.jsonl")
+        self.fix = fix
+        self.registry = registry or default_registry
+
+        self._report_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+        os.makedirs(self.output_root, exist_ok=True)
+
+    def _reset_stats(self):
+        self.stats: Dict = {
+            "total": 0,
+            "skipped": 0,
+            "success": 0,
+            "failed": 0,
+            "error": 0,
+            "busy_seconds": 0.0,
+            "elapsed_seconds": 0.0
+        }
+
+    def collect_inputs(self, source: str) -> Dict[str, str]:
+        """
+        收集待转换的C++文件
+        :param source: 目录（递归查找 .cpp）、JSON 清单（路径列表）或文本清单（每行一个路径，# 开头为注释）
+        :return: {C++文件路径: 输出子目录名}
+        """
+        if os.path.isdir(source):
+            paths = sorted(glob.glob(os.path.join(source, "**", "*.cpp"), recursive=True))
+            # 目录输入时输出子目录保留相对路径结构
+            return {
+                path: os.path.splitext(os.path.relpath(path, source))[0]
+                for path in paths
+            }
+
+        with open(source, 'r', encoding='utf-8') as f:
+            if source.endswith(".json"):
+                paths = json.load(f)
+            else:
+                paths = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        base_dir = os.path.dirname(source)
+        inputs = {}
+        for path in paths:
+            if not os.path.isabs(path):
+                path = os.path.join(base_dir, path)
+            # 清单中的文件可能同名，用路径哈希区分输出目录
+            stem = os.path.splitext(os.path.basename(path))[0]
+            digest = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:8]
+            inputs[path] = f"{stem}_{digest}"
+        return inputs
+
+    def _load_completed(self) -> set:
+        """读取已有报告，返回已完成（success/failed）的文件；error 的文件在恢复时重试"""
+        completed = set()
+        if not os.path.exists(self.report_path):
+            return completed
+        with open(self.report_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 崩溃时可能留下不完整的最后一行
+                if record.get("status") in ("success", "failed"):
+                    completed.add(os.path.abspath(record["cpp_path"]))
+        return completed
+
+    def _write_result(self, result: BatchResult):
+        """追加一行结果到报告，立即落盘以便崩溃后恢复"""
+        with self._report_lock:
+            with open(self.report_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(asdict(result), ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _find_input_file(self, cpp_path: str) -> Optional[str]:
+        """查找与C++文件同名的 .in 输入文件"""
+        input_file = os.path.splitext(cpp_path)[0] + ".in"
+        return input_file if os.path.exists(input_file) else None
+
+    def _process(self, cpp_path: str, output_name: str) -> BatchResult:
+        """转换并修正单个文件，使用独立的Agent实例"""
+        start_time = time.time()
+        output_dir = os.path.join(self.output_root, output_name)
+        rust_path = os.path.join(
+            output_dir,
+            os.path.splitext(os.path.basename(cpp_path))[0] + ".rs"
+        )
+        agents = []
+        try:
+            converter = CodeConverterAgent(
+                client=self.client,
+                model_name=self.model_name,
+                input_path=cpp_path,
+                output_dir=output_dir,
+                knowledge_base_path=self.knowledge_base_path,
+                embedding_model=self.embedding_model,
+                registry=self.registry
+            )
+            agents.append(converter)
+            converter.convert()
+
+            if not self.fix:
+                status, message = "success", "代码转换完成"
+            else:
+                modifier = CodeModifierAgent(
+                    client=self.client,
+                    model_name=self.model_name,
+                    rust_path=rust_path,
+                    cpp_path=cpp_path,
+                    knowledge_base_path=self.knowledge_base_path,
+                    embedding_model=self.embedding_model,
+                    registry=self.registry
+                )
+                agents.append(modifier)
+                success, message = modifier.diagnose_and_fix(
+                    input_file=self._find_input_file(cpp_path)
+                )
+                status = "success" if success else "failed"
+        except Exception as e:
+            status, message = "error", str(e)
+        finally:
+            for agent in agents:
+                agent.close()
+
+        return BatchResult(
+            cpp_path=cpp_path,
+            status=status,
+            output_dir=output_dir,
+            rust_path=rust_path,
+            message=message,
+            duration=time.time() - start_time,
+            finished_at=time.time()
+        )
+
+    def run(self, source: str, resume: bool = True) -> Dict:
+        """
+        执行批量转换
+        :param source: 目录或清单文件，见 collect_inputs()
+        :param resume: 是否跳过报告中已完成的文件（用于崩溃后恢复）
+        :return: 吞吐统计
+        """
+        self._reset_stats()
+        inputs = self.collect_inputs(source)
+        completed = self._load_completed() if resume else set()
+        pending = {
+            path: name for path, name in inputs.items()
+            if os.path.abspath(path) not in completed
+        }
+        self.stats["total"] = len(inputs)
+        self.stats["skipped"] = len(inputs) - len(pending)
+        print(f"共 {len(inputs)} 个文件，跳过已完成 {self.stats['skipped']} 个，待处理 {len(pending)} 个")
+
+        # 整个批次持有一份知识库引用：每个文件的 Agent 用完即释放，
+        # 没有这份引用时计数归零，下一个文件会重新加载索引
+        knowledge_base = self.registry.acquire(
+            self.knowledge_base_path,
+            embedding_model=self.embedding_model
+        )
+        start_time = time.time()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [
+                    executor.submit(self._process, path, name)
+                    for path, name in pending.items()
+                ]
+                for future in as_completed(futures):
+                    result = future.result()
+                    self._write_result(result)
+                    with self._stats_lock:
+                        self.stats[result.status] += 1
+                        self.stats["busy_seconds"] += result.duration
+                        self.stats["elapsed_seconds"] = time.time() - start_time
+                    print(f"[{result.status}] {result.cpp_path}（耗时 {result.duration:.1f}秒）")
+        finally:
+            self.registry.release(knowledge_base)
+
+        return self.get_stats()
+
+    def get_stats(self) -> Dict:
+        """
+        返回吞吐统计：处理数量、成功率、每分钟文件数、平均单文件耗时
+        """
+        with self._stats_lock:
+            stats = dict(self.stats)
+        processed = stats["success"] + stats["failed"] + stats["error"]
+        elapsed = stats["elapsed_seconds"]
+        stats["processed"] = processed
+        stats["files_per_minute"] = processed / elapsed * 60 if elapsed > 0 else 0.0
+        stats["avg_seconds_per_file"] = stats["busy_seconds"] / processed if processed else 0.0
+        stats["success_rate"] = stats["success"] / processed if processed else 0.0
+        return stats
+
+# ===== 使用示例 =====
+if __name__ == "__main__":
+    llm_client = UnifiedLLMClient()
+    llm_client.add_model(
+        model_name="ollama-llama3",
+        config=llm_client.configs["ollama"],
+        model="llama3.1"
+    )
+
+    pipeline = BatchConversionPipeline(
+        client=llm_client,
+        model_name="ollama-llama3",
+        output_root="../../test_code/batch_output",
+        knowledge_base_path="../../knowledge_base",
+        max_workers=4
+    )
+
+    # 目录下所有 .cpp 文件（也可以传入 JSON/文本清单）
+    stats = pipeline.run("../../test_code")
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
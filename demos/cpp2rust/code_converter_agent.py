@@ -2,6 +2,7 @@ import sys
 sys.path.append("../../agent")
 from unified_llm_client import UnifiedLLMClient
 from rag_agent import RAGAgent
+from knowledge_base import KnowledgeBaseRegistry
 import os
 import re
 from typing import Optional
@@ -16,7 +17,8 @@ class CodeConverterAgent(RAGAgent):
         knowledge_base_path: str,
         embedding_model: str = "all-MiniLM-L6-v2",
         max_history: int = 10,
-        system_prompt: Optional[str] = None
+        system_prompt: Optional[str] = None,
+        registry: Optional[KnowledgeBaseRegistry] = None
     ):
         """
         初始化代码转换AI Agent
@@ -27,6 +29,7 @@ class CodeConverterAgent(RAGAgent):
         :param knowledge_base_path: 知识库路径
         :param embedding_model: 嵌入模型
         :param max_history: 保留的对话历史长度
+        :param registry: 共享知识库索引的注册表（默认进程内共享）
         """
         # 设置默认系统提示
         default_system_prompt = (
@@ -47,7 +50,8 @@ class CodeConverterAgent(RAGAgent):
             knowledge_base_path=knowledge_base_path,
             embedding_model=embedding_model,
             system_prompt=system_prompt or default_system_prompt,
-            max_history=max_history
+            max_history=max_history,
+            registry=registry
         )
         # print("system prompt : \n", self.system_prompt, "\n")
         self.input_path = input_path
@@ -66,15 +70,8 @@ class CodeConverterAgent(RAGAgent):
             raise RuntimeError(f"读取文件失败：{str(e)}")
 
     def _parse_response(self, response: str) -> dict:
-        """解析模型响应"""
-        try:
-            import json
-            result = json.loads(response)
-            if not all(k in result for k in ["rust_code", "cargo_toml"]):
-                raise ValueError("响应缺少必要字段")
-            return result
-        except json.JSONDecodeError:
-            raise ValueError("无效的JSON格式")
+        """解析模型响应，格式不符时请求模型修复JSON"""
+        return self._parse_structured(response, {"rust_code": str, "cargo_toml": (str, type(None))})
 
     def _save_generated_files(self, rust_code: str, toml_content: str):
         """保存生成的文件"""
@@ -106,8 +103,10 @@ class CodeConverterAgent(RAGAgent):
         cpp_code = self.load_cpp_code()
         # print("cpp code : ", cpp_code)
         
+        # C++ 代码固定在系统提示之后，多轮转换时不会在历史中重复出现
+        self.set_static_context(f"需要转换的C++代码：\n```cpp\n{cpp_code}\n```")
         # 构造提示语
-        prompt = f"请将以下C++代码转换为Rust代码：\n```cpp\n{cpp_code}\n```"
+        prompt = "请将上文的C++代码转换为Rust代码"
         if additional_instructions:
             prompt += f"\n附加要求：{additional_instructions}"
         
@@ -2,13 +2,67 @@ import sys
 sys.path.append("../../agent")
 from unified_llm_client import UnifiedLLMClient
 from rag_agent import RAGAgent
+from knowledge_base import KnowledgeBaseRegistry
 import sys
 sys.path.append("../rust-compile-run")
 sys.path.append("../cpp-compile-run")
 from Rust import Rust
 from Cpp import Cpp
+from build_cache import BuildCache
+from sandbox import ExecutionLimits
+from workspace import Workspace, WorkspaceManager
+from patching import PatchError, apply_search_replace
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+import difflib
+import glob
+import os
 import re
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass
+class TestCaseResult:
+    """单个测试输入上 Rust 与 C++ 的运行结果"""
+    input_file: Optional[str]
+    rust_status: int
+    rust_output: str
+    cpp_status: int
+    cpp_output: str
+
+    @property
+    def passed(self) -> bool:
+        return (
+            self.rust_status == 0 and self.cpp_status == 0
+            and self.rust_output.strip() == self.cpp_output.strip()
+        )
+
+
+@dataclass
+class CandidateResult:
+    """一个候选修正在独立目录中编译、测试后的结果"""
+    index: int
+    variant: Dict
+    response: str
+    code: str
+    compiled: bool = False
+    error_count: int = 0
+    compile_output: str = ""
+    results: List[TestCaseResult] = field(default_factory=list)
+    workspace: Optional[Workspace] = None
+
+    @property
+    def passed_count(self) -> int:
+        return sum(result.passed for result in self.results)
+
+    @property
+    def all_passed(self) -> bool:
+        return self.compiled and bool(self.results) and all(result.passed for result in self.results)
+
+    def score(self) -> Tuple:
+        """通过的用例越多越好，其次是能编译、编译错误越少越好，同分时取靠前的候选"""
+        return (self.passed_count, self.compiled, -self.error_count, -self.index)
+
 
 class CodeModifierAgent(RAGAgent):
     def __init__(
@@ -20,7 +74,23 @@ class CodeModifierAgent(RAGAgent):
         knowledge_base_path: str,
         embedding_model: str = "all-MiniLM-L6-v2",
         max_history: int = 10,
-        system_prompt: Optional[str] = None
+        system_prompt: Optional[str] = None,
+        registry: Optional[KnowledgeBaseRegistry] = None,
+        build_cache: Optional[BuildCache] = None,
+        max_test_workers: Optional[int] = None,
+        max_reported_diffs: int = 3,
+        run_limits: Optional[ExecutionLimits] = None,
+        rust_build_mode: str = "rustc",
+        cargo_target_dir: Optional[str] = None,
+        fast_fail_check: bool = True,
+        structured_diagnostics: bool = True,
+        diagnostic_token_budget: int = 1500,
+        num_candidates: int = 1,
+        candidate_temperatures: Optional[List[float]] = None,
+        candidate_models: Optional[List[str]] = None,
+        candidate_selection: str = "best",
+        workspace_manager: Optional[WorkspaceManager] = None,
+        response_mode: str = "full"
     ):
         """
         初始化代码修正AI Agent
@@ -31,17 +101,57 @@ class CodeModifierAgent(RAGAgent):
         :param knowledge_base_path: 知识库路径
         :param embedding_model: 嵌入模型
         :param max_history: 保留的对话历史长度
+        :param registry: 共享知识库索引的注册表（默认进程内共享）
+        :param build_cache: 编译缓存，默认使用 ~/.cache/simpleagent/build，
+                            未修改的源码（如C++参考代码）不会重复编译
+        :param max_test_workers: 并发运行测试用例的线程数，默认为 CPU 核数
+        :param max_reported_diffs: 提示中最多展示的失败用例差异数
+        :param run_limits: 运行 Rust/C++ 程序时的资源限制（超时、内存等）
+        :param rust_build_mode: Rust 编译模式，"rustc" 或 "cargo"（增量编译，支持 Cargo.toml 中的依赖）
+        :param cargo_target_dir: cargo 模式共享的 CARGO_TARGET_DIR
+        :param fast_fail_check: 完整编译前先做不生成代码的快速检查（rustc --emit=metadata / cargo check /
+                                g++ -fsyntax-only），类型和借用错误无需等待代码生成和链接
+        :param structured_diagnostics: 使用编译器的 JSON 诊断输出，去重、排序并截断后再放入提示
+        :param diagnostic_token_budget: 提示中编译诊断的 token 上限
+        :param num_candidates: 每轮并发请求的候选修正数，大于 1 时各候选在独立目录中并行编译和测试
+        :param candidate_temperatures: 各候选使用的温度（循环使用），默认在 0.3~0.9 之间均匀分布
+        :param candidate_models: 各候选使用的模型（循环使用，需已在 client 中配置），默认只用 model_name
+        :param candidate_selection: "best" 等待全部候选并选择得分最高者；"first" 采用第一个通过全部用例的候选
+        :param workspace_manager: 为每次尝试分配独立工作目录（默认优先使用 tmpfs），
+                                  修正过程中不改动 rust_path，成功后才原子地发布源码和可执行文件
+        :param response_mode: "full" 每轮返回完整代码；"patch" 只返回 search/replace 补丁，
+                              输出长度与文件大小无关，补丁无法应用时再请求完整代码
         """
+        if candidate_selection not in ("best", "first"):
+            raise ValueError(f"不支持的候选选择策略：{candidate_selection}")
+        if response_mode not in ("full", "patch"):
+            raise ValueError(f"不支持的响应模式：{response_mode}")
+        if response_mode == "patch":
+            response_format = (
+                "请严格按照以下JSON格式响应，只返回需要修改的片段：\n"
+                "{\n"
+                "    \"analysis\": \"问题分析\",\n"
+                "    \"patches\": [\n"
+                "        {\"search\": \"当前代码中需要替换的连续片段（逐字复制，足以唯一定位）\", "
+                "\"replace\": \"替换后的片段\"}\n"
+                "    ],\n"
+                "    \"changes\": \"修改说明\"\n"
+                "}\n"
+            )
+        else:
+            response_format = (
+                "请严格按照以下JSON格式响应：\n"
+                "{\n"
+                "    \"analysis\": \"问题分析\",\n"
+                "    \"modified_code\": \"修正后的代码\",\n"
+                "    \"changes\": \"修改说明\"\n"
+                "}\n"
+            )
         default_system_prompt = (
             "你是一个专业的代码修正专家，负责诊断和修复Rust代码问题。"
             "你需要根据编译/运行时错误分析问题，保持与原始C++代码的逻辑一致性，"
             "并使用Rust的安全最佳实践。\n\n"
-            "请严格按照以下JSON格式响应：\n"
-            "{\n"
-            "    \"analysis\": \"问题分析\",\n"
-            "    \"modified_code\": \"修正后的代码\",\n"
-            "    \"changes\": \"修改说明\"\n"
-            "}\n"
+            f"{response_format}"
         )
         
         super().__init__(
@@ -50,14 +160,41 @@ class CodeModifierAgent(RAGAgent):
             knowledge_base_path=knowledge_base_path,
             embedding_model=embedding_model,
             system_prompt=system_prompt or default_system_prompt,
-            max_history=max_history
+            max_history=max_history,
+            registry=registry
         )
         
         self.rust_path = rust_path
         self.cpp_path = cpp_path
-        self.rust_runner = Rust(rust_path)
-        self.cpp_runner = Cpp(cpp_path)
+        self.response_mode = response_mode
+        self.build_cache = build_cache or BuildCache()
+        self.run_limits = run_limits or ExecutionLimits()
+        self.rust_build_mode = rust_build_mode
+        self.cargo_target_dir = cargo_target_dir
+        self.fast_fail_check = fast_fail_check
+        self.diagnostic_format = "json" if structured_diagnostics else "human"
+        self.diagnostic_token_budget = diagnostic_token_budget
+        self.workspace_manager = workspace_manager or WorkspaceManager()
+        self.workspace: Optional[Workspace] = None  # 当前尝试的工作目录，首次诊断时创建
+        self.rust_runner = self._make_rust_runner()
+        self.cpp_runner = Cpp(cpp_path, build_cache=self.build_cache, limits=self.run_limits,
+                              check_first=fast_fail_check, diagnostic_format=self.diagnostic_format,
+                              diagnostic_token_budget=diagnostic_token_budget)
         self.max_retry = 5  # 最大重试次数
+        self.max_test_workers = max_test_workers or os.cpu_count() or 1
+        self.max_reported_diffs = max_reported_diffs
+        self.num_candidates = num_candidates
+        self.candidate_temperatures = candidate_temperatures or [
+            round(0.3 + 0.6 * i / max(num_candidates - 1, 1), 2) for i in range(num_candidates)
+        ]
+        self.candidate_models = candidate_models or [model_name]
+        self.candidate_selection = candidate_selection
+
+        # C++ 参考实现的编译结果、源码和各输入的运行输出，C++ 文件变化时失效
+        self._cpp_signature: Optional[Tuple[int, int]] = None
+        self._cpp_code: Optional[str] = None
+        self._cpp_compile_result: Optional[Tuple[int, str]] = None
+        self._cpp_outputs: Dict[Tuple, Tuple[int, str]] = {}
 
     def _compile_and_run_rust(self, input_file=None) -> Tuple[int, str]:
         """编译并运行Rust代码"""
@@ -68,14 +205,113 @@ class CodeModifierAgent(RAGAgent):
         run_flag, run_output = self.rust_runner.rust_run(input_file)
         return run_flag, run_output
 
-    def _compile_and_run_cpp(self, input_file=None) -> Tuple[int, str]:
-        """编译并运行C++代码"""
-        compile_flag, compile_output = self.cpp_runner.cpp_compile()
-        if compile_flag != 0:
-            return 1, f"C++编译错误：\n{compile_output}"
-        
-        run_flag, run_output = self.cpp_runner.cpp_run(input_file)
-        return run_flag, run_output
+    def _prepare_cpp_outputs(self, inputs: List[Optional[str]]) -> Dict[Optional[str], Tuple[int, str]]:
+        """
+        在当前线程编译并运行C++代码，准备所有输入的参考输出
+        （结果按输入文件缓存，C++ 文件变化时重新编译；未缓存的输入在线程池中并发运行）
+        返回 输入文件 -> (状态, 输出)，并发的测试和候选评估只读取该结果，不访问缓存
+        """
+        self._refresh_cpp_cache()
+        keys = {input_file: (input_file, _file_signature(input_file) if input_file else None)
+                for input_file in inputs}
+        missing = [input_file for input_file, key in keys.items() if key not in self._cpp_outputs]
+        if missing:
+            if self._cpp_compile_result is None:
+                self._cpp_compile_result = self.cpp_runner.cpp_compile()
+            compile_flag, compile_output = self._cpp_compile_result
+            if compile_flag != 0:
+                results = [(1, f"C++编译错误：\n{compile_output}")] * len(missing)
+            elif len(missing) == 1 or self.max_test_workers <= 1:
+                results = [self.cpp_runner.cpp_run(input_file) for input_file in missing]
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_test_workers, len(missing))) as executor:
+                    results = list(executor.map(self.cpp_runner.cpp_run, missing))
+            for input_file, result in zip(missing, results):
+                self._cpp_outputs[keys[input_file]] = result
+        return {input_file: self._cpp_outputs[key] for input_file, key in keys.items()}
+
+    def _load_cpp_code(self) -> str:
+        """读取C++源代码（缓存，C++ 文件变化时重新读取）"""
+        self._refresh_cpp_cache()
+        if self._cpp_code is None:
+            with open(self.cpp_path, 'r', encoding='utf-8') as f:
+                self._cpp_code = f.read()
+        return self._cpp_code
+
+    def _refresh_cpp_cache(self):
+        """C++ 文件的 mtime 或大小变化时清空参考实现的缓存"""
+        signature = _file_signature(self.cpp_path)
+        if signature != self._cpp_signature:
+            self._cpp_signature = signature
+            self._cpp_code = None
+            self._cpp_compile_result = None
+            self._cpp_outputs = {}
+
+    def _collect_test_inputs(self, input_spec: Optional[str]) -> List[Optional[str]]:
+        """
+        解析测试输入：单个文件、目录（其中所有非隐藏文件）或 glob 模式
+        未指定时返回 [None]，即不带输入运行一次
+        """
+        if not input_spec:
+            return [None]
+        if os.path.isdir(input_spec):
+            paths = [
+                os.path.join(input_spec, name) for name in sorted(os.listdir(input_spec))
+                if not name.startswith('.') and os.path.isfile(os.path.join(input_spec, name))
+            ]
+        elif any(ch in input_spec for ch in "*?["):
+            paths = sorted(path for path in glob.glob(input_spec) if os.path.isfile(path))
+        else:
+            return [input_spec]
+        if not paths:
+            raise ValueError(f"未找到测试输入：{input_spec}")
+        return paths
+
+    def _run_test_case(self, input_file: Optional[str], cpp_result: Tuple[int, str]) -> TestCaseResult:
+        """在一个输入上运行 Rust，并与预先准备的 C++ 输出对比"""
+        rust_status, rust_output = self.rust_runner.rust_run(input_file)
+        cpp_status, cpp_output = cpp_result
+        return TestCaseResult(input_file, rust_status, rust_output, cpp_status, cpp_output)
+
+    def _run_test_cases(self, inputs: List[Optional[str]]) -> List[TestCaseResult]:
+        """在线程池中并发运行所有测试用例（需先完成 Rust 编译）"""
+        # 先在当前线程准备好全部 C++ 参考输出，工作线程不修改缓存
+        cpp_outputs = self._prepare_cpp_outputs(inputs)
+        cpp_results = [cpp_outputs[input_file] for input_file in inputs]
+        if len(inputs) == 1 or self.max_test_workers <= 1:
+            return [self._run_test_case(input_file, cpp_result)
+                    for input_file, cpp_result in zip(inputs, cpp_results)]
+        with ThreadPoolExecutor(max_workers=min(self.max_test_workers, len(inputs))) as executor:
+            return list(executor.map(self._run_test_case, inputs, cpp_results))
+
+    def _format_test_report(self, results: List[TestCaseResult]) -> str:
+        """生成紧凑的通过/失败矩阵，并附上前几个失败用例的差异"""
+        passed = sum(result.passed for result in results)
+        lines = [f"测试结果：{passed}/{len(results)} 通过"]
+        for result in results:
+            name = os.path.basename(result.input_file) if result.input_file else "(无输入)"
+            if result.passed:
+                status = "通过"
+            elif result.rust_status != 0:
+                status = "失败（Rust运行错误）"
+            else:
+                status = "失败（输出不一致）"
+            lines.append(f"- {name}: {status}")
+
+        failed = [result for result in results if not result.passed][:self.max_reported_diffs]
+        for result in failed:
+            name = os.path.basename(result.input_file) if result.input_file else "(无输入)"
+            if result.rust_status != 0:
+                lines.append(f"\n用例 {name} Rust运行错误：\n{result.rust_output}")
+            else:
+                diff = difflib.unified_diff(
+                    result.cpp_output.strip().splitlines(),
+                    result.rust_output.strip().splitlines(),
+                    fromfile="C++ 输出", tofile="Rust 输出", lineterm="", n=2
+                )
+                diff_lines = list(diff)[:40]
+                lines.append(f"\n用例 {name} 输出差异：\n" + "\n".join(diff_lines))
+        return "\n".join(lines)
 
     def _get_code_diff(self, rust_out: str, cpp_out: str) -> str:
         """生成输出差异分析"""
@@ -86,93 +322,210 @@ class CodeModifierAgent(RAGAgent):
             "请确保逻辑一致"
         )
 
-    def _parse_response(self, response: str) -> str:
-        """解析模型响应中的代码"""
-        # print("inside _parse_response")
-        try:
-            # print("inside try")
-            import json
-            # print("imported json")
-            # print("response:\n", response)
-            # print(type(response))
-            response = response[response.index("{"):response.rindex("}") + 1]
-            # print("response:\n", response)
-            try:
-                result = json.loads(response)
-            except json.JSONDecodeError:
-                # print("json.loads failed")
-                # 处理可能的JSON解析错误
-                print("response:\n", response)
-                raise ValueError("无效的JSON格式")
-            print("result:\n", result)
-            if "modified_code" not in result:
-                raise ValueError("响应缺少必要字段")
+    def _parse_response(self, response: str, repair: bool = True) -> str:
+        """
+        解析模型响应中的代码
+        :param repair: 本地解析失败时是否请求模型修复JSON
+        """
+        result = self._parse_structured(response, {"modified_code": str}, repair_attempts=int(repair))
+        return result["modified_code"]
+
+    def _parse_patch_response(self, response: str, current_code: str, repair: bool = True) -> str:
+        """解析补丁模式的响应，把 search/replace 补丁应用到当前代码上，返回完整代码"""
+        result = self._parse_structured(response, validator=_validate_patch_response, repair_attempts=int(repair))
+        if result.get("modified_code"):
+            # 模型直接给出了完整代码
             return result["modified_code"]
-        except json.JSONDecodeError:
-            raise ValueError("无效的JSON格式")
+        return apply_search_replace(current_code, result["patches"])
+
+    def _extract_code(self, response: str, current_code: str, repair: bool = True) -> str:
+        """按响应模式从回复中得到修正后的完整代码，补丁无法应用时抛出 PatchError"""
+        if self.response_mode == "patch":
+            return self._parse_patch_response(response, current_code, repair)
+        return self._parse_response(response, repair)
+
+    def _code_from_response(self, response: str) -> str:
+        """
+        从回复中得到修正后的完整代码
+        补丁模式下任意补丁无法应用时，追加一轮对话请求完整代码
+        """
+        try:
+            return self._extract_code(response, self._current_rust_code())
+        except PatchError as e:
+            print(f"补丁应用失败，改为请求完整代码：{str(e)}")
+            response = self.chat(
+                f"补丁无法应用：{str(e)}\n"
+                "请改为返回完整的修正后代码，JSON 中用 \"modified_code\" 字段代替 \"patches\"",
+                max_tokens=2000, temperature=0.3
+            )
+            return self._parse_response(response)
+
+    def _error_prompt(self, rust_output: str) -> str:
+        """编译/运行错误的提示；补丁模式下需要附上当前代码供模型逐字引用"""
+        prompt = f"编译/运行时错误：\n{rust_output}\n请分析并修正代码"
+        if self.response_mode == "patch":
+            prompt = f"当前rust代码：\n{self._current_rust_code()}\n{prompt}"
+        return prompt
 
     def _update_rust_code(self, new_code: str):
-        """更新Rust代码文件"""
+        """把新代码写入一个新的工作目录，并切换到该目录（rust_path 保持不变）"""
         try:
-            print("rust_path = ", self.rust_path)
-            with open(self.rust_path, 'w', encoding='utf-8') as f:
-                f.write(new_code)
-            # 重新初始化runner以加载新代码
-            self.rust_runner = Rust(self.rust_path)
+            workspace = self.workspace_manager.create(os.path.basename(self.rust_path), new_code)
+            print("workspace = ", workspace.root)
+            self._switch_workspace(workspace)
         except Exception as e:
             raise RuntimeError(f"更新代码失败：{str(e)}")
 
+    def _ensure_workspace(self):
+        """首次诊断时把 rust_path 的当前内容复制到工作目录"""
+        if self.workspace is None:
+            with open(self.rust_path, 'r', encoding='utf-8') as f:
+                code = f.read()
+            self._switch_workspace(self.workspace_manager.create(os.path.basename(self.rust_path), code))
+
+    def _switch_workspace(self, workspace: Workspace):
+        """切换当前工作目录并重新创建 runner，旧目录随即删除"""
+        previous, self.workspace = self.workspace, workspace
+        self.rust_runner = self._make_rust_runner(workspace)
+        if previous is not None and previous is not workspace:
+            previous.cleanup()
+
+    def _current_rust_code(self) -> str:
+        """当前尝试中的 Rust 代码（尚未开始诊断时为 rust_path 的内容）"""
+        if self.workspace is not None:
+            return self.workspace.read_source()
+        with open(self.rust_path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def _promote_workspace(self):
+        """修正成功后，把工作目录中的源码和可执行文件原子地发布到 rust_path"""
+        if self.workspace is not None:
+            self.workspace.promote(self.rust_path, os.path.splitext(self.rust_path)[0])
+            print(f"已更新 {self.rust_path}")
+
+    def _finish_success(self, results: List[TestCaseResult]) -> Tuple[bool, str]:
+        """发布通过测试的代码，并生成返回给调用方的输出"""
+        self._promote_workspace()
+        if len(results) == 1:
+            return True, results[0].rust_output
+        return True, self._format_test_report(results)
+
+    def close(self):
+        """删除工作目录并释放知识库引用"""
+        if self.workspace is not None:
+            self.workspace.cleanup()
+            self.workspace = None
+        super().close()
+
+    def _make_rust_runner(self, workspace: Optional[Workspace] = None, candidate_index: Optional[int] = None) -> Rust:
+        """
+        按当前配置创建 Rust 编译运行器
+        工作目录每次尝试都不同，cargo 包、Cargo.toml 依赖、编译缓存键和诊断路径都以 rust_path 为准，
+        各次尝试共享同一个 cargo 包的增量编译结果
+        :param workspace: 工作目录，源码和可执行文件都位于其中；None 表示直接使用 rust_path
+        :param candidate_index: 并行候选的序号，每个序号使用独立的 cargo 包（可跨轮复用），
+                                候选的编译结果直接用于下一轮，不写入编译缓存
+        """
+        source_path = workspace.source_path if workspace else self.rust_path
+        return Rust(
+            source_path,
+            executable_path=workspace.executable_path if workspace else None,
+            build_cache=self.build_cache if candidate_index is None else None,
+            limits=self.run_limits,
+            build_mode=self.rust_build_mode,
+            cargo_target_dir=self.cargo_target_dir,
+            cargo_toml_path=os.path.join(os.path.dirname(os.path.abspath(self.rust_path)), "Cargo.toml"),
+            check_first=self.fast_fail_check,
+            diagnostic_format=self.diagnostic_format,
+            diagnostic_token_budget=self.diagnostic_token_budget,
+            logical_path=self.rust_path,
+            cargo_build_key=f"candidate{candidate_index}" if candidate_index is not None else None
+        )
+
     def diagnose_and_fix(self, instruction: Optional[str] = None, input_file: Optional[str] = None) -> Tuple[bool, str]:
         """
         执行诊断和修复流程
         :param instruction: 可选的人工修正指令
-        :param input_file: 可选的输入文件路径
+        :param input_file: 可选的测试输入：单个文件、目录或 glob 模式（如 "tests/*.in"），
+                           多个输入时 Rust 与 C++ 在所有输入上并发对比
         :return: (是否成功, 最终输出)
         """
+        inputs = self._collect_test_inputs(input_file)
+        self._ensure_workspace()
+        # C++ 参考代码在整个修正会话中不变，固定在系统提示之后，每轮提示只携带易变的内容
+        self.set_static_context(f"原始cpp代码：\n{self._load_cpp_code()}")
+        winner: Optional[CandidateResult] = None  # 上一轮选中的候选，其编译和测试结果在本轮直接复用
         for attempt in range(self.max_retry):
             print(f"\n=== 第{attempt+1}次尝试 ===")
             
-            # 步骤1：编译运行Rust
-            rust_status, rust_output = self._compile_and_run_rust(input_file)
-            
-            # 步骤2：如果Rust运行成功，验证与C++的一致性
-            if rust_status == 0:
-                print("Rust编译和运行成功")
-                cpp_status, cpp_output = self._compile_and_run_cpp(input_file)
-                if cpp_status != 0:
-                    print(f"C++代码验证失败：\n{cpp_output}")
-                    return False, f"C++代码验证失败：{cpp_output}"
-                
-                if rust_output.strip() == cpp_output.strip():
-                    return True, rust_output
-                
-                # 输出不一致时生成差异提示并读取两个源文件
-                diff_analysis = self._get_code_diff(rust_output, cpp_output)
-                with open(self.cpp_path, 'r', encoding='utf-8') as f:
-                    cpp_code = f.read()
-                with open(self.rust_path, 'r', encoding='utf-8') as f:
-                    rust_code = f.read()
-                
-                print(f"\n输出不一致：\n{diff_analysis}")
-                prompt = (
-                    f"原始cpp代码：\n{cpp_code}\n"
-                    f"需要修正的rust代码：\n{rust_code}\n"
-                    f"输出不一致：\n{diff_analysis}\n"
-                    "请确保两者逻辑相同"
-                )
+            # 步骤1：编译Rust
+            if winner is not None:
+                compile_flag = 0 if winner.compiled else 1
+                compile_output = winner.compile_output
             else:
+                compile_flag, compile_output = self.rust_runner.rust_compile()
+            if compile_flag != 0:
+                rust_output = f"编译错误：\n{compile_output}"
                 print(f"\nRust编译/运行错误：\n{rust_output}")
-                prompt = f"编译/运行时错误：\n{rust_output}\n请分析并修正代码"
+                prompt = self._error_prompt(rust_output)
+            else:
+                # 步骤2：在所有测试输入上运行，验证与C++的一致性
+                results = winner.results if winner is not None else self._run_test_cases(inputs)
+                for result in results:
+                    if result.cpp_status != 0:
+                        print(f"C++代码验证失败：\n{result.cpp_output}")
+                        return False, f"C++代码验证失败：{result.cpp_output}"
+
+                if all(result.passed for result in results):
+                    print("Rust编译和运行成功")
+                    return self._finish_success(results)
+
+                if len(results) == 1 and results[0].rust_status != 0:
+                    rust_output = results[0].rust_output
+                    print(f"\nRust编译/运行错误：\n{rust_output}")
+                    prompt = self._error_prompt(rust_output)
+                else:
+                    # 输出不一致时生成差异提示并读取两个源文件
+                    if len(results) == 1:
+                        diff_analysis = self._get_code_diff(results[0].rust_output, results[0].cpp_output)
+                    else:
+                        diff_analysis = self._format_test_report(results)
+                    rust_code = self._current_rust_code()
+
+                    print(f"\n输出不一致：\n{diff_analysis}")
+                    prompt = (
+                        "原始cpp代码见上文\n"
+                        f"需要修正的rust代码：\n{rust_code}\n"
+                        f"输出不一致：\n{diff_analysis}\n"
+                        "请确保两者逻辑相同"
+                    )
             
             # 添加人工指令
             if instruction:
                 prompt += f"\n附加要求：{instruction}"
             
+            # 并发生成多个候选修正，在独立目录中并行验证
+            if self.num_candidates > 1:
+                try:
+                    winner = self._fix_with_candidates(prompt, inputs)
+                    self._switch_workspace(winner.workspace)
+                    self.message_history.append({
+                        "role": "system",
+                        "content": f"第{attempt+1}次修正后的代码片段：\n{winner.code[:300]}..."
+                    })
+                except Exception as e:
+                    return False, f"修正失败：{str(e)}"
+                if winner.all_passed:
+                    # 候选的工作目录中已有通过全部用例的可执行文件，直接发布
+                    print(f"候选 {winner.index + 1} 通过全部测试")
+                    return self._finish_success(winner.results)
+                continue
+
             # 调用LLM获取修正方案
             try:
                 response = self.chat(prompt, max_tokens=2000, temperature=0.3)
                 print("response:\n", response)
-                new_code = self._parse_response(response)
+                new_code = self._code_from_response(response)
                 print("new_code:\n", new_code)
                 # 更新Rust代码
                 self._update_rust_code(new_code)
@@ -187,6 +540,100 @@ class CodeModifierAgent(RAGAgent):
         
         return False, f"经过{self.max_retry}次尝试仍未解决问题"
 
+    def _candidate_variants(self) -> List[Dict]:
+        """为每个候选分配模型和温度"""
+        return [
+            {
+                "model_name": self.candidate_models[i % len(self.candidate_models)],
+                "temperature": self.candidate_temperatures[i % len(self.candidate_temperatures)]
+            }
+            for i in range(self.num_candidates)
+        ]
+
+    def _fix_with_candidates(self, prompt: str, inputs: List[Optional[str]]) -> CandidateResult:
+        """
+        并发请求多个候选修正，每个候选在独立的临时目录中编译和测试
+        返回选中的候选（"first" 模式下为第一个通过全部用例的候选，否则为得分最高者），
+        并把它的回复记录到对话历史
+        """
+        variants = self._candidate_variants()
+        current_code = self._current_rust_code()
+        responses = self.chat_many(prompt, variants, max_tokens=2000)
+        candidates = []
+        for index, (variant, response) in enumerate(zip(variants, responses)):
+            if response is None:
+                continue
+            try:
+                # 其他候选仍可用，解析失败的候选不再请求修复
+                code = self._extract_code(response, current_code, repair=False)
+                candidates.append(CandidateResult(index, variant, response, code))
+            except ValueError as e:
+                print(f"候选 {index + 1} 解析失败：{str(e)}")
+        if not candidates:
+            raise ValueError("所有候选修正均生成或解析失败")
+
+        # 先在当前线程准备好全部输入的 C++ 参考输出，候选评估时只读取该结果
+        cpp_outputs = self._prepare_cpp_outputs(inputs)
+        executor = ThreadPoolExecutor(max_workers=len(candidates))
+        futures = []
+        winner = None
+
+        def release(candidate: CandidateResult):
+            # 未选中的候选结束后删除其工作目录（已结束的立即执行；评估出错的候选同样删除）
+            if candidate is not winner and candidate.workspace is not None:
+                candidate.workspace.cleanup()
+
+        try:
+            futures = [
+                executor.submit(self._evaluate_candidate, candidate, inputs, cpp_outputs)
+                for candidate in candidates
+            ]
+            evaluated = []
+            for future in as_completed(futures):
+                candidate = future.result()
+                evaluated.append(candidate)
+                print(f"候选 {candidate.index + 1}（{candidate.variant}）："
+                      f"{'编译通过' if candidate.compiled else f'{candidate.error_count} 个编译错误'}，"
+                      f"{candidate.passed_count}/{len(inputs)} 个用例通过")
+                if self.candidate_selection == "first" and candidate.all_passed:
+                    break
+            winner = max(evaluated, key=lambda candidate: candidate.score())
+        finally:
+            # "first" 模式下不等待其余候选，它们会在后台结束；出错时 winner 为 None，全部删除
+            executor.shutdown(wait=False, cancel_futures=True)
+            for candidate, future in zip(candidates, futures):
+                future.add_done_callback(lambda _, candidate=candidate: release(candidate))
+        self._record_response(winner.response)
+        return winner
+
+    def _evaluate_candidate(
+        self,
+        candidate: CandidateResult,
+        inputs: List[Optional[str]],
+        cpp_outputs: Dict[Optional[str], Tuple[int, str]]
+    ) -> CandidateResult:
+        """
+        在独立的工作目录中编译候选代码，并在所有输入上与 C++ 输出对比
+        :param cpp_outputs: 预先准备的 C++ 参考输出（见 _prepare_cpp_outputs）
+        """
+        candidate.workspace = self.workspace_manager.create(
+            os.path.basename(self.rust_path), candidate.code, prefix=f"candidate-{candidate.index}-"
+        )
+        runner = self._make_rust_runner(candidate.workspace, candidate_index=candidate.index)
+        compile_flag, compile_output = runner.rust_compile()
+        candidate.compile_output = compile_output
+        if compile_flag != 0:
+            errors = [d for d in runner.last_diagnostics if d.is_error]
+            candidate.error_count = len(errors) or max(compile_output.count("error"), 1)
+            return candidate
+
+        candidate.compiled = True
+        for input_file in inputs:
+            rust_status, rust_output = runner.rust_run(input_file)
+            cpp_status, cpp_output = cpp_outputs[input_file]
+            candidate.results.append(TestCaseResult(input_file, rust_status, rust_output, cpp_status, cpp_output))
+        return candidate
+
     def interactive_fixing(self, input_file: Optional[str] = None):
         """
         交互式修正流程
@@ -226,14 +673,29 @@ class CodeModifierAgent(RAGAgent):
                     print(output)
                     break
             elif choice == '3':
-                with open(self.rust_path, 'r') as f:
-                    print(f"\n当前Rust代码：\n{f.read()}")
+                print(f"\n当前Rust代码：\n{self._current_rust_code()}")
             elif choice == '4':
                 print("终止修正流程")
                 break
             else:
                 print("无效输入，请重新选择")
 
+def _validate_patch_response(result: Dict):
+    """补丁模式的响应需要包含 patches 数组或完整的 modified_code"""
+    if isinstance(result.get("modified_code"), str) and result["modified_code"]:
+        return
+    if not isinstance(result.get("patches"), list):
+        raise ValueError("响应缺少必要字段：patches（数组）或 modified_code")
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+    """返回文件的 (mtime, 大小)，文件不存在时返回 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
 # ===== 使用示例 =====
 if __name__ == "__main__":
     # 初始化LLM客户端
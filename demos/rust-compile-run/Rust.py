@@ -1,8 +1,70 @@
 import subprocess
+import hashlib
+import os
+import re
+import sys
+import tempfile
+sys.path.append("../../agent")
+from build_cache import BuildCache, copy_executable
+from diagnostics import summarize_compiler_output
+from sandbox import ExecutionLimits, ExecutionResult, run_sandboxed
+
+# cargo 模式下所有 crate 共享的 target 目录，依赖和增量编译结果可以跨次复用
+DEFAULT_CARGO_TARGET_DIR = os.path.join(os.path.expanduser("~"), ".cache", "simpleagent", "cargo-target")
 
 class Rust:
-    def __init__(self, file_path):
+    def __init__(
+        self,
+        file_path,
+        build_cache: BuildCache = None,
+        limits: ExecutionLimits = None,
+        build_mode: str = "rustc",
+        cargo_target_dir: str = None,
+        cargo_toml_path: str = None,
+        check_first: bool = False,
+        diagnostic_format: str = "human",
+        diagnostic_token_budget: int = 1500,
+        executable_path: str = None,
+        logical_path: str = None,
+        cargo_build_key: str = None
+    ):
+        """
+        :param file_path: 源代码路径
+        :param build_cache: 可选的编译缓存，源码和编译参数未变时直接复用上次的编译结果
+        :param limits: 运行程序时的资源限制（超时、CPU、内存、进程数、输出大小），默认使用 ExecutionLimits()
+        :param build_mode: "rustc" 直接编译单个文件；"cargo" 使用 cargo 增量编译（支持依赖）
+        :param cargo_target_dir: cargo 模式共享的 CARGO_TARGET_DIR，默认为 ~/.cache/simpleagent/cargo-target
+        :param cargo_toml_path: 生成的 Cargo.toml 路径（从中读取依赖），默认为 logical_path 同目录下的 Cargo.toml
+        :param check_first: 编译前是否先执行不生成代码的快速检查（rust_check），类型/借用错误可以更快返回
+        :param diagnostic_format: "human" 原样返回编译器输出；"json" 使用 --error-format=json，
+                                  返回去重、排序并截断后的诊断（结构化结果保存在 last_diagnostics）
+        :param diagnostic_token_budget: json 模式下诊断文本的 token 上限
+        :param executable_path: 可执行文件路径，默认为源文件路径去掉 .rs 后缀
+        :param logical_path: 源码的逻辑路径（如修正结果最终发布的位置），默认与 file_path 相同；
+                             源码位于每次尝试都不同的临时目录时，cargo 包名、.cargo_build 位置、
+                             编译缓存键和诊断中的文件路径都以它为准，多次尝试可以复用增量编译和缓存
+        :param cargo_build_key: 区分同一 logical_path 下并发编译的不同版本（如并行候选），
+                                各自使用独立的 cargo 包，默认不区分
+        """
+        if diagnostic_format not in ("human", "json"):
+            raise ValueError(f"不支持的诊断格式：{diagnostic_format}")
+        if build_mode not in ("rustc", "cargo"):
+            raise ValueError(f"不支持的编译模式：{build_mode}")
         self.file_path = file_path
+        self.logical_path = logical_path or file_path
+        self.cargo_build_key = cargo_build_key
+        self.executable_path = executable_path or file_path[:-3]  # 默认去掉 .rs 后缀
+        self.build_cache = build_cache
+        self.limits = limits or ExecutionLimits()
+        self.build_mode = build_mode
+        self.cargo_target_dir = cargo_target_dir or DEFAULT_CARGO_TARGET_DIR
+        self.cargo_toml_path = cargo_toml_path or os.path.join(
+            os.path.dirname(os.path.abspath(self.logical_path)), "Cargo.toml"
+        )
+        self.check_first = check_first
+        self.diagnostic_format = diagnostic_format
+        self.diagnostic_token_budget = diagnostic_token_budget
+        self.last_diagnostics = []
 	
     def rust_compile(self):
         """
@@ -16,16 +78,198 @@ class Rust:
             success_flag(int)： 0 for success, 1 for failure
             result_message(str)：Compilation output or error message
         """
+        if self.build_mode == "cargo":
+            compile_flag, compile_output = self._cargo_compile()
+        else:
+            compile_flag, compile_output = self._rustc_compile()
+        return compile_flag, self._summarize_diagnostics(compile_flag, compile_output)
+
+    def _rustc_compile(self):
+        """使用 rustc 编译单个文件，返回编译器的原始输出"""
         file_path = self.file_path
-        executable_path = file_path[:-3]  # 去掉 .rs 后缀，得到可执行文件的路径
+        executable_path = self.executable_path
+        flags = self._diagnostic_flags()
+        cache_key = self._cache_key('rustc', flags)
+        if cache_key is not None:
+            cached = self.build_cache.lookup(cache_key, executable_path)
+            if cached is not None:
+                return cached
+
+        compile_flag, compile_output = 0, ""
+        if self.check_first:
+            compile_flag, compile_output = self._rustc_check()
+        if compile_flag == 0:
+            try:
+                # 使用 subprocess 模块的 run 方法调用 bash 命令，使用 -o 选项指定输出文件位置
+                result = subprocess.run(['rustc', file_path, *flags, '-o', executable_path], 
+                                     check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                compile_flag, compile_output = 0, result.stdout.decode()
+            except subprocess.CalledProcessError as e:
+                compile_flag, compile_output = 1, e.stderr.decode()
+
+        compile_output = self._logical_paths(compile_output)
+        if cache_key is not None:
+            self.build_cache.store(cache_key, compile_flag, compile_output, executable_path)
+        return compile_flag, compile_output
+
+    def rust_check(self):
+        """
+        快速检查：只做解析、类型和借用检查，不生成代码也不链接
+        rustc 模式使用 --emit=metadata，cargo 模式使用 cargo check
+
+        Returns:
+        pair：
+            success_flag(int)： 0 for success, 1 for failure
+            result_message(str)：检查输出或错误信息
+        """
+        if self.build_mode == "cargo":
+            manifest_path, _ = self._prepare_cargo_manifest()
+            check_flag, check_output = self._run_cargo('check', manifest_path)
+        else:
+            check_flag, check_output = self._rustc_check()
+        return check_flag, self._summarize_diagnostics(check_flag, self._logical_paths(check_output))
+
+    def _rustc_check(self):
+        """rustc --emit=metadata 检查，返回编译器的原始输出"""
+        with tempfile.TemporaryDirectory(prefix="rust-check-") as out_dir:
+            try:
+                result = subprocess.run(['rustc', self.file_path, *self._diagnostic_flags(),
+                                         '--emit=metadata', '--out-dir', out_dir],
+                                     check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                return 0, result.stdout.decode()
+            except subprocess.CalledProcessError as e:
+                return 1, e.stderr.decode()
+
+    def _cargo_compile(self):
+        """
+        使用 cargo 编译：共享 CARGO_TARGET_DIR 并开启增量编译，
+        可选先执行 cargo check（check_first），编译成功后把可执行文件复制到与 rustc 模式相同的位置
+        """
+        executable_path = self.executable_path
+        manifest_path, bin_name = self._prepare_cargo_manifest()
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = f.read()
+        # manifest 中的源文件路径每次尝试都可能不同，不计入缓存键
+        cache_key = self._cache_key('cargo', [self._logical_paths(manifest), *self._diagnostic_flags()])
+        if cache_key is not None:
+            cached = self.build_cache.lookup(cache_key, executable_path)
+            if cached is not None:
+                return cached
+
+        compile_flag, compile_output = 0, ""
+        if self.check_first:
+            compile_flag, compile_output = self._run_cargo('check', manifest_path)
+        if compile_flag == 0:
+            compile_flag, compile_output = self._run_cargo('build', manifest_path)
+        if compile_flag == 0:
+            copy_executable(os.path.join(self.cargo_target_dir, "debug", bin_name), executable_path)
+
+        compile_output = self._logical_paths(compile_output)
+        if cache_key is not None:
+            self.build_cache.store(cache_key, compile_flag, compile_output, executable_path)
+        return compile_flag, compile_output
+
+    def _run_cargo(self, command, manifest_path):
+        """执行 cargo 子命令，返回 (0/1, 输出)"""
+        env = dict(os.environ, CARGO_TARGET_DIR=self.cargo_target_dir, CARGO_INCREMENTAL="1")
+        json_format = self.diagnostic_format == "json"
+        message_format = ['--message-format=json'] if json_format else []
         try:
-            # 使用 subprocess 模块的 run 方法调用 bash 命令，使用 -o 选项指定输出文件位置
-            result = subprocess.run(['rustc', file_path, '-o', executable_path], 
-                                 check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            result = subprocess.run(['cargo', command, '-q', '--manifest-path', manifest_path, *message_format],
+                                 check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
             return 0, result.stdout.decode()
         except subprocess.CalledProcessError as e:
+            # json 模式下诊断写在 stdout，stderr 中只有汇总信息（或 manifest 错误）
+            if json_format:
+                return 1, e.stdout.decode() + e.stderr.decode()
             return 1, e.stderr.decode()
 
+    def _prepare_cargo_manifest(self):
+        """
+        生成 cargo 模式使用的 Cargo.toml，返回 (manifest 路径, 可执行文件名)
+        生成的 Cargo.toml 不一定符合 cargo 的目录约定，因此在 .cargo_build 下维护一个
+        以源文件为 bin 目标的 manifest，并复制其中的 [dependencies] 等依赖配置；
+        包名和 manifest 位置由 logical_path 决定：同一份代码的多次尝试复用同一个包的增量编译结果，
+        包名带路径哈希，避免共享 target 目录时不同 crate 的产物互相覆盖
+        """
+        source_path = os.path.abspath(self.file_path)
+        logical_path = os.path.abspath(self.logical_path)
+        stem = os.path.splitext(os.path.basename(logical_path))[0]
+        if self.cargo_build_key:
+            stem = f"{stem}-{self.cargo_build_key}"
+        digest = hashlib.sha1(f"{logical_path}:{self.cargo_build_key or ''}".encode('utf-8')).hexdigest()[:8]
+        bin_name = f"sa_{re.sub(r'[^A-Za-z0-9_]', '_', stem)}_{digest}"
+
+        edition, dependencies = "2021", ""
+        if os.path.exists(self.cargo_toml_path):
+            with open(self.cargo_toml_path, 'r', encoding='utf-8') as f:
+                edition, dependencies = _parse_cargo_toml(f.read(), edition)
+
+        manifest = (
+            "[package]\n"
+            f"name = \"{bin_name}\"\n"
+            "version = \"0.1.0\"\n"
+            f"edition = \"{edition}\"\n\n"
+            "[[bin]]\n"
+            f"name = \"{bin_name}\"\n"
+            f"path = {_toml_string(source_path)}\n\n"
+            "[profile.dev]\n"
+            "incremental = true\n\n"
+            # 独立 workspace，避免 cargo 向上找到用户目录下的 Cargo.toml
+            "[workspace]\n\n"
+            f"{dependencies}"
+        )
+        crate_dir = os.path.join(os.path.dirname(logical_path), ".cargo_build", stem)
+        manifest_path = os.path.join(crate_dir, "Cargo.toml")
+        os.makedirs(crate_dir, exist_ok=True)
+        # 内容不变时不重写，避免 mtime 变化触发重新编译
+        existing = None
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                existing = f.read()
+        if existing != manifest:
+            with open(manifest_path, 'w', encoding='utf-8') as f:
+                f.write(manifest)
+        return manifest_path, bin_name
+
+    def _diagnostic_flags(self):
+        return ['--error-format=json'] if self.diagnostic_format == "json" else []
+
+    def _summarize_diagnostics(self, compile_flag, compile_output):
+        """json 模式下把编译器输出解析为结构化诊断，返回精简后的文本"""
+        if self.diagnostic_format != "json":
+            return compile_output
+        self.last_diagnostics, text = summarize_compiler_output(
+            compile_output, self.build_mode, self.diagnostic_token_budget
+        )
+        if compile_flag == 0 and not self.last_diagnostics:
+            return ""
+        return text
+
+    def _cache_key(self, compiler, flags):
+        """
+        计算编译缓存键，未配置缓存或源文件不存在时返回 None
+        诊断信息中的文件路径已替换为 logical_path，因此计入缓存键的是稳定的 logical_path，
+        源码位于每次不同的临时目录时，相同的代码仍然命中同一条缓存
+        """
+        if self.build_cache is None or not os.path.exists(self.file_path):
+            return None
+        return self.build_cache.make_key(
+            [self.file_path], compiler, flags + [os.path.abspath(self.logical_path)]
+        )
+
+    def _logical_paths(self, text):
+        """把编译输出中的实际源文件路径替换为 logical_path"""
+        if self.logical_path == self.file_path:
+            return text
+        source_path = os.path.abspath(self.file_path)
+        text = text.replace(source_path, os.path.abspath(self.logical_path))
+        if self.file_path != source_path:
+            # 相对路径：跳过已替换的绝对路径中的片段
+            pattern = r'(?<![\w./-])' + re.escape(self.file_path)
+            text = re.sub(pattern, lambda match: self.logical_path, text)
+        return text
+
     def rust_run(self, input_file=None):
         """
         Run executable file
@@ -38,26 +282,51 @@ class Rust:
             success_flag(int): 0 for success, 1 for failure
             result_message(str): Runtime output or error message
         """
-        executable_path = self.file_path[:-3]  # 去掉 .rs 后缀，得到可执行文件的路径
         try:
-            if input_file:
-                # 如果提供了输入文件，从文件重定向输入
-                with open(input_file, 'r') as f:
-                    result = subprocess.run([executable_path],
-                                         input=f.read().encode(),
-                                         check=True,
-                                         stdout=subprocess.PIPE,
-                                         stderr=subprocess.PIPE)
-            else:
-                result = subprocess.run([executable_path],
-                                     check=True,
-                                     stdout=subprocess.PIPE,
-                                     stderr=subprocess.PIPE)
-            return 0, result.stdout.decode()
-        except subprocess.CalledProcessError as e:
-            return 1, e.stderr.decode()
-        except FileNotFoundError as e:
+            result = self.rust_run_detailed(input_file)
+        except FileNotFoundError:
             return 1, f"Input file not found: {input_file}"
+        if result.ok:
+            return 0, result.stdout
+        return 1, result.error_message()
+
+    def rust_run_detailed(self, input_file=None) -> ExecutionResult:
+        """
+        在资源受限的沙箱中运行可执行文件，返回结构化结果
+        （状态：ok / exit / timeout / cpu_timeout / oom / signal / output_limit / error）
+        """
+        executable_path = self.executable_path
+        input_data = None
+        if input_file:
+            # 如果提供了输入文件，从文件重定向输入
+            with open(input_file, 'rb') as f:
+                input_data = f.read()
+        return run_sandboxed([executable_path], input_data, self.limits)
+
+def _parse_cargo_toml(content, default_edition):
+    """从 Cargo.toml 中提取 edition 和所有依赖相关的节（[dependencies]、[dependencies.xxx] 等）"""
+    edition = default_edition
+    match = re.search(r'^\s*edition\s*=\s*"(\d{4})"', content, re.MULTILINE)
+    if match:
+        edition = match.group(1)
+
+    sections = []
+    current = None
+    for line in content.splitlines():
+        header = re.match(r'^\s*\[([^\[\]]+)\]\s*$', line)
+        if header or line.strip().startswith("[["):
+            name = header.group(1).strip() if header else ""
+            current = [line] if name.split(".")[0].endswith("dependencies") else None
+            if current is not None:
+                sections.append(current)
+        elif current is not None:
+            current.append(line)
+    return edition, "\n".join("\n".join(section) for section in sections) + ("\n" if sections else "")
+
+
+def _toml_string(value):
+    """转义为 TOML 基本字符串"""
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
 
 # 使用示例
 if __name__ == '__main__':
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# agent/ 下的模块按扁平方式相互导入（如 from token_counter import ...），与 demos 的用法一致
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agent"))
@@ -0,0 +1,51 @@
+import os
+
+from build_cache import BuildCache
+
+
+def _entry_exists(cache, key):
+    return os.path.isdir(os.path.join(cache.cache_dir, key[:2], key))
+
+
+def _set_atime(cache, key, timestamp):
+    entry_dir = os.path.join(cache.cache_dir, key[:2], key)
+    os.utime(entry_dir, (timestamp, timestamp))
+
+
+def test_store_and_lookup(tmp_path):
+    cache = BuildCache(str(tmp_path / "cache"))
+    binary = tmp_path / "binary"
+    binary.write_bytes(b"\x7fELF")
+    cache.store("ab" + "0" * 62, 0, "ok", str(binary))
+
+    restored = tmp_path / "restored"
+    assert cache.lookup("ab" + "0" * 62, str(restored)) == (0, "ok")
+    assert restored.read_bytes() == b"\x7fELF"
+    assert cache.lookup("cd" + "0" * 62) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_prune_evicts_least_recently_used(tmp_path):
+    cache = BuildCache(str(tmp_path / "cache"), max_entries=2, max_bytes=None)
+    keys = [f"{i:02d}" + "0" * 62 for i in range(3)]
+    cache.store(keys[0], 1, "error 0")
+    cache.store(keys[1], 1, "error 1")
+    _set_atime(cache, keys[0], 1000)
+    _set_atime(cache, keys[1], 2000)
+    # 命中会刷新访问时间，keys[1] 变为最久未访问
+    assert cache.lookup(keys[0]) == (1, "error 0")
+
+    cache.store(keys[2], 1, "error 2")
+    assert _entry_exists(cache, keys[0])
+    assert not _entry_exists(cache, keys[1])
+    assert _entry_exists(cache, keys[2])
+
+
+def test_prune_by_total_size(tmp_path):
+    cache = BuildCache(str(tmp_path / "cache"), max_entries=None, max_bytes=1500)
+    keys = [f"{i:02d}" + "0" * 62 for i in range(3)]
+    for index, key in enumerate(keys):
+        cache.store(key, 1, "x" * 600)
+        _set_atime(cache, key, 1000 + index)
+    cache.prune()
+    assert [_entry_exists(cache, key) for key in keys] == [False, True, True]
@@ -0,0 +1,94 @@
+import json
+
+from diagnostics import format_diagnostics, parse_gcc_json, parse_rustc_json, rank_diagnostics
+
+
+def _rustc_record(level, message, code=None, line=2, label=None, children=()):
+    return {
+        "$message_type": "diagnostic",
+        "level": level,
+        "message": message,
+        "code": {"code": code} if code else None,
+        "spans": [{
+            "file_name": "src/main.rs",
+            "line_start": line,
+            "column_start": 18,
+            "is_primary": True,
+            "label": label,
+            "text": [{"text": "    let x: i32 = \"a\";", "highlight_start": 18, "highlight_end": 21}]
+        }],
+        "children": list(children)
+    }
+
+
+def test_parse_rustc_json():
+    help_child = {
+        "level": "help",
+        "message": "try using a conversion method",
+        "spans": [{"suggested_replacement": "\"a\".parse().unwrap()"}]
+    }
+    output = "\n".join([
+        json.dumps(_rustc_record("error", "mismatched types", "E0308", label="expected `i32`, found `&str`",
+                                 children=[help_child])),
+        json.dumps({"$message_type": "diagnostic", "level": "error",
+                    "message": "aborting due to 1 previous error", "spans": [], "children": []}),
+        "not json"
+    ])
+    diagnostics = parse_rustc_json(output)
+    assert len(diagnostics) == 1
+    diagnostic = diagnostics[0]
+    assert (diagnostic.level, diagnostic.code, diagnostic.message) == ("error", "E0308", "mismatched types")
+    assert (diagnostic.file, diagnostic.line, diagnostic.column) == ("src/main.rs", 2, 18)
+    assert diagnostic.label == "expected `i32`, found `&str`"
+    assert diagnostic.highlight == (18, 21)
+    assert diagnostic.notes == ["help: try using a conversion method：`\"a\".parse().unwrap()`"]
+    assert diagnostic.is_error
+
+
+def test_parse_cargo_compiler_messages():
+    output = "\n".join([
+        json.dumps({"reason": "compiler-artifact", "package_id": "mylib"}),
+        json.dumps({"reason": "compiler-message", "message": _rustc_record("warning", "unused variable: `y`")}),
+        json.dumps({"reason": "build-finished", "success": True})
+    ])
+    diagnostics = parse_rustc_json(output)
+    assert [(d.level, d.message) for d in diagnostics] == [("warning", "unused variable: `y`")]
+
+
+def test_parse_gcc_json_reads_snippet_from_source(tmp_path):
+    source = tmp_path / "main.cpp"
+    source.write_text("int main() {\n    int x = y;\n}\n")
+    output = json.dumps([{
+        "kind": "error",
+        "message": "'y' was not declared in this scope",
+        "locations": [{
+            "caret": {"file": str(source), "line": 2, "column": 13},
+            "finish": {"file": str(source), "line": 2, "column": 13}
+        }],
+        "children": [{"kind": "note", "message": "suggested alternative",
+                      "locations": [{"caret": {"line": 1}}]}]
+    }])
+    diagnostics = parse_gcc_json("In file included...\n" + output, str(source))
+    assert len(diagnostics) == 1
+    diagnostic = diagnostics[0]
+    assert (diagnostic.level, diagnostic.line, diagnostic.column) == ("error", 2, 13)
+    assert diagnostic.snippet == "    int x = y;"
+    assert diagnostic.highlight == (13, 14)
+    assert diagnostic.notes == ["note: suggested alternative（第 1 行）"]
+
+
+def test_parse_gcc_json_invalid_output():
+    assert parse_gcc_json("g++: fatal error: no input files") == []
+    assert parse_gcc_json("[not json]") == []
+
+
+def test_rank_puts_errors_first_and_folds_duplicates():
+    records = [
+        _rustc_record("warning", "unused variable: `y`", line=1),
+        _rustc_record("error", "mismatched types", "E0308", line=2, label="expected `i32`"),
+        _rustc_record("error", "mismatched types", "E0308", line=5, label="expected `i32`")
+    ]
+    ranked = rank_diagnostics(parse_rustc_json("\n".join(json.dumps(r) for r in records)))
+    assert [d.level for d in ranked] == ["error", "warning"]
+    assert [d.line for d in ranked[0].duplicates] == [5]
+    assert "src/main.rs:5:18" in format_diagnostics(ranked)
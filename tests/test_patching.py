@@ -0,0 +1,57 @@
+import pytest
+
+from patching import PatchError, apply_search_replace
+
+CODE = "fn main() {\n    let x = 1;\n    println!(\"{}\", x);\n}"
+
+
+def test_exact_match():
+    patched = apply_search_replace(CODE, [{"search": "let x = 1;", "replace": "let x = 2;"}])
+    assert "let x = 2;" in patched
+    assert "let x = 1;" not in patched
+
+
+def test_patches_apply_in_order():
+    patches = [
+        {"search": "let x = 1;", "replace": "let y = 1;"},
+        {"search": "println!(\"{}\", x);", "replace": "println!(\"{}\", y);"}
+    ]
+    assert apply_search_replace(CODE, patches) == "fn main() {\n    let y = 1;\n    println!(\"{}\", y);\n}"
+
+
+def test_whitespace_fallback_reindents_replace():
+    # 模型给出的片段缩进不同：按行忽略空白匹配，replace 平移到原代码的缩进
+    patches = [{"search": "let x = 1;\nprintln!(\"{}\", x);", "replace": "let x = 3;\nprintln!(\"{}\", x);"}]
+    assert apply_search_replace(CODE, patches) == "fn main() {\n    let x = 3;\n    println!(\"{}\", x);\n}"
+
+
+def test_empty_replace_deletes_lines():
+    patched = apply_search_replace(CODE, [{"search": "\tprintln!(\"{}\", x);", "replace": ""}])
+    assert patched == "fn main() {\n    let x = 1;\n}"
+
+
+def test_missing_search_raises():
+    with pytest.raises(PatchError, match="不存在"):
+        apply_search_replace(CODE, [{"search": "let z = 0;", "replace": ""}])
+
+
+def test_ambiguous_search_raises():
+    code = "a();\nb();\na();"
+    with pytest.raises(PatchError, match="出现了 2 次"):
+        apply_search_replace(code, [{"search": "a();", "replace": "c();"}])
+
+
+@pytest.mark.parametrize("patches", [
+    [],
+    None,
+    ["not a dict"],
+    [{"search": "   ", "replace": "x"}],
+    [{"search": "let x = 1;", "replace": 1}],
+])
+def test_malformed_patches_raise(patches):
+    with pytest.raises(PatchError):
+        apply_search_replace(CODE, patches)
+
+
+def test_patch_error_is_value_error():
+    assert issubclass(PatchError, ValueError)
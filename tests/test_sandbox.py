@@ -0,0 +1,39 @@
+import sys
+
+from sandbox import ExecutionLimits, run_sandboxed
+
+
+def _python(code):
+    return [sys.executable, "-c", code]
+
+
+def test_ok_with_stdin():
+    result = run_sandboxed(_python("import sys; print(sys.stdin.read().upper())"), input_data=b"abc")
+    assert result.ok
+    assert result.stdout.strip() == "ABC"
+
+
+def test_nonzero_exit():
+    result = run_sandboxed(_python("import sys; sys.stderr.write('bad'); sys.exit(3)"))
+    assert (result.status, result.exit_code) == ("exit", 3)
+    assert result.error_message().startswith("bad")
+
+
+def test_wall_timeout_kills_process():
+    result = run_sandboxed(_python("import time; time.sleep(30)"), limits=ExecutionLimits(wall_timeout=0.5))
+    assert result.status == "timeout"
+    assert result.duration < 10
+
+
+def test_output_limit_truncates_and_kills():
+    limits = ExecutionLimits(max_output_bytes=1024)
+    result = run_sandboxed(_python("while True: print('x' * 100)"), limits=limits)
+    assert result.status == "output_limit"
+    assert result.stdout_truncated
+    assert result.stdout.startswith("x" * 100)
+    assert len(result.stdout.encode()) < 2048
+
+
+def test_missing_executable():
+    result = run_sandboxed(["/nonexistent/program"])
+    assert result.status == "error"
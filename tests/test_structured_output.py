@@ -0,0 +1,57 @@
+import pytest
+
+from structured_output import (
+    StructuredOutputError, extract_json, parse_json_response, repair_json, validate_schema
+)
+
+
+def test_repair_unescaped_newline_in_string():
+    assert extract_json('{"code": "fn main() {\n}"}') == {"code": "fn main() {\n}"}
+
+
+def test_repair_invalid_escape():
+    assert extract_json(r'{"pattern": "\d+"}') == {"pattern": "\\d+"}
+
+
+def test_repair_trailing_commas_and_comments():
+    text = '{\n  "a": [1, 2,],  // 注释\n  "b": "x",\n}'
+    assert extract_json(text) == {"a": [1, 2], "b": "x"}
+
+
+def test_repair_keeps_comment_markers_inside_strings():
+    assert repair_json('{"url": "http://example.com"}') == '{"url": "http://example.com"}'
+
+
+def test_extract_from_fenced_block_with_surrounding_text():
+    text = '说明文字\n```json\n{"answer": "ok"}\n```\n后续说明'
+    assert extract_json(text) == {"answer": "ok"}
+
+
+def test_extract_skips_leading_braces_in_prose():
+    assert extract_json('使用 {} 占位：{"answer": 1} 结束') == {"answer": 1}
+
+
+def test_extract_without_json_raises():
+    with pytest.raises(StructuredOutputError):
+        extract_json("没有 JSON")
+
+
+def test_parse_returns_first_object_matching_schema():
+    text = '{"other": 1}\n{"modified_code": "fn main() {}"}'
+    assert parse_json_response(text, {"modified_code": str}) == {"modified_code": "fn main() {}"}
+
+
+def test_parse_reports_schema_error():
+    with pytest.raises(StructuredOutputError, match="modified_code"):
+        parse_json_response('{"code": "x"}', {"modified_code": str})
+
+
+def test_validate_schema_type_and_validator():
+    with pytest.raises(StructuredOutputError, match="字段 a"):
+        validate_schema({"a": 1}, {"a": str})
+
+    def validator(data):
+        raise ValueError("自定义错误")
+
+    with pytest.raises(StructuredOutputError, match="自定义错误"):
+        validate_schema({"a": "x"}, {"a": str}, validator)
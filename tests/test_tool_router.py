@@ -0,0 +1,28 @@
+from tool_router import RouteDecision, ToolRouter
+
+RULES = {
+    "converter": [(r"\bconvert\b", 2.0), (r"转换", 2.0)],
+    "explainer": [(r"\bexplain\b", 2.0)]
+}
+
+
+def test_rules_route_with_confidence():
+    decision = ToolRouter(RULES).route("Please convert main.cpp")
+    assert (decision.tool, decision.action, decision.source) == ("converter", "Please convert main.cpp", "rules")
+    assert ToolRouter(RULES).route("hello") is None
+
+
+def test_cache_hit_uses_current_text_as_action():
+    router = ToolRouter(RULES)
+    router.remember("Fix Main.rs!", RouteDecision("modifier", "修正 Main.rs 中的错误", "模型选择", 0.9, "llm"))
+    decision = router.route("fix main.rs")
+    assert (decision.tool, decision.reason, decision.source) == ("modifier", "模型选择", "cache")
+    assert decision.action == "fix main.rs"
+
+
+def test_cache_is_lru_bounded():
+    router = ToolRouter(RULES, cache_size=1)
+    router.remember("a", RouteDecision("converter", "a"))
+    router.remember("b", RouteDecision("explainer", "b"))
+    assert router.route("a") is None
+    assert router.route("b").tool == "explainer"